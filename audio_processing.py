@@ -0,0 +1,248 @@
+import io
+import itertools
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+import speech_recognition as sr
+
+try:
+    import soundfile  # libsndfile wheels ship their own FLAC encoder, no external binary needed
+except (ImportError, OSError):
+    soundfile = None
+
+# --- Preprocessing Defaults ---
+# Google's recognizer (and most others) work at 16 kHz / 16-bit mono, so anything
+# captured above that is just extra bytes on the wire.
+TARGET_SAMPLE_RATE = 16000
+TARGET_SAMPLE_WIDTH = 2
+
+VAD_FRAME_MS = 30           # Energy is measured over frames of this length
+VAD_MARGIN_DB = 10.0        # A frame is speech if it is this much louder than the noise floor
+VAD_MIN_SPEECH_DB = -50.0   # ...and at least this loud (dBFS); clips entirely below this count as silence
+VAD_MAX_THRESHOLD_DB = -35.0  # Frames this loud always count, so an all-speech clip is never trimmed away
+VAD_PADDING_MS = 200        # Audio kept around each speech region so word edges are not clipped
+VAD_MAX_PAUSE_MS = 400      # Internal pauses are shortened to this length
+
+RESAMPLE_FILTER_TAPS = 63
+
+
+def pcm_to_float(raw_data, sample_width, channels=1):
+    """Converts little-endian PCM bytes to a float32 array of shape (frames, channels) in [-1, 1]."""
+    if sample_width == 1:  # 8-bit WAV data is unsigned
+        samples = (np.frombuffer(raw_data, dtype=np.uint8).astype(np.float32) - 128.0) / 128.0
+    elif sample_width == 2:
+        samples = np.frombuffer(raw_data, dtype="<i2").astype(np.float32) / 32768.0
+    elif sample_width == 3:
+        packed = np.frombuffer(raw_data, dtype=np.uint8).reshape(-1, 3).astype(np.int32)
+        values = packed[:, 0] | (packed[:, 1] << 8) | (packed[:, 2] << 16)
+        values = np.where(values & 0x800000, values - 0x1000000, values)
+        samples = values.astype(np.float32) / 8388608.0
+    elif sample_width == 4:
+        samples = np.frombuffer(raw_data, dtype="<i4").astype(np.float32) / 2147483648.0
+    else:
+        raise ValueError(f"Unsupported sample width: {sample_width}")
+    usable = len(samples) - len(samples) % channels
+    return samples[:usable].reshape(-1, channels)
+
+
+def float_to_pcm16(samples):
+    """Converts a float array in [-1, 1] to 16-bit little-endian PCM bytes."""
+    return (np.clip(samples, -1.0, 1.0) * 32767.0).astype("<i2").tobytes()
+
+
+def downmix_to_mono(samples):
+    """Averages all channels of a (frames, channels) array into a 1-D mono signal."""
+    if samples.shape[1] == 1:
+        return samples[:, 0]
+    return samples.mean(axis=1)
+
+
+def detect_speech_mask(mono, sample_rate):
+    """Returns (frame_length, boolean mask of frames that contain speech) using an adaptive energy threshold."""
+    frame_length = max(1, int(sample_rate * VAD_FRAME_MS / 1000))
+    frame_count = len(mono) // frame_length
+    if frame_count == 0:
+        return frame_length, np.zeros(0, dtype=bool)
+
+    frames = mono[:frame_count * frame_length].reshape(frame_count, frame_length)
+    rms = np.sqrt(np.mean(frames * frames, axis=1)) + 1e-10
+    frame_db = 20.0 * np.log10(rms)
+
+    noise_floor_db = np.percentile(frame_db, 10)
+    threshold_db = min(max(noise_floor_db + VAD_MARGIN_DB, VAD_MIN_SPEECH_DB), VAD_MAX_THRESHOLD_DB)
+    speech = frame_db > threshold_db
+    if not speech.any():
+        # Quiet throughout (soft voice, low mic gain): keep everything above the absolute floor rather than drop the clip
+        speech = frame_db > VAD_MIN_SPEECH_DB
+    return frame_length, speech
+
+
+def contains_speech(raw_data, sample_rate, sample_width):
+    """True when any frame of the mono PCM passes the speech threshold."""
+    _, mask = detect_speech_mask(pcm_to_float(raw_data, sample_width), sample_rate)
+    return bool(mask.any())
+
+
+def trim_silence(mono, sample_rate):
+    """Drops leading/trailing silence and shortens long internal pauses. Returns an empty array if no speech was found."""
+    frame_length, speech = detect_speech_mask(mono, sample_rate)
+    if not speech.any():
+        return mono[:0]
+
+    # Grow every speech region by the padding so soft word onsets/endings survive.
+    padding_frames = max(1, VAD_PADDING_MS // VAD_FRAME_MS)
+    kernel = np.ones(2 * padding_frames + 1)
+    keep = np.convolve(speech.astype(np.float32), kernel, mode="same") > 0
+
+    # Keep at most VAD_MAX_PAUSE_MS of every remaining internal gap.
+    max_pause_frames = max(1, VAD_MAX_PAUSE_MS // VAD_FRAME_MS)
+    edges = np.flatnonzero(np.diff(keep.astype(np.int8))) + 1
+    run_starts = np.concatenate(([0], edges))
+    run_ends = np.concatenate((edges, [len(keep)]))
+    first_kept = np.argmax(keep)
+    last_kept = len(keep) - 1 - np.argmax(keep[::-1])
+    for start, end in zip(run_starts, run_ends):
+        if keep[start] or start < first_kept or end > last_kept:
+            continue
+        keep[start:start + max_pause_frames] = True
+
+    sample_mask = np.repeat(keep, frame_length)
+    # The tail shorter than one frame belongs to the last frame's decision.
+    tail = len(mono) - len(sample_mask)
+    if tail > 0:
+        sample_mask = np.concatenate((sample_mask, np.full(tail, keep[-1])))
+    return mono[sample_mask]
+
+
+def resample(mono, source_rate, target_rate=TARGET_SAMPLE_RATE):
+    """Resamples a mono float signal with a windowed-sinc anti-aliasing filter followed by linear interpolation."""
+    if source_rate == target_rate or len(mono) == 0:
+        return mono
+
+    if target_rate < source_rate:
+        cutoff = 0.5 * target_rate / source_rate * 0.95  # fraction of the source sample rate
+        n = np.arange(RESAMPLE_FILTER_TAPS) - (RESAMPLE_FILTER_TAPS - 1) / 2
+        taps = 2 * cutoff * np.sinc(2 * cutoff * n) * np.hamming(RESAMPLE_FILTER_TAPS)
+        taps /= taps.sum()
+        mono = np.convolve(mono, taps.astype(np.float32), mode="same")
+
+    duration = len(mono) / source_rate
+    target_length = max(1, int(round(duration * target_rate)))
+    source_times = np.arange(len(mono)) / source_rate
+    target_times = np.arange(target_length) / target_rate
+    return np.interp(target_times, source_times, mono).astype(np.float32)
+
+
+def preprocess_audio(raw_data, sample_rate, sample_width, channels=1):
+    """
+    Trims silence, downmixes to mono and resamples to 16 kHz / 16-bit.
+    Returns (raw_bytes, sample_rate, sample_width, stats); raw_bytes is empty when no speech was detected.
+    """
+    cpu_start = time.thread_time()
+
+    samples = pcm_to_float(raw_data, sample_width, channels)
+    mono = downmix_to_mono(samples)
+    speech = trim_silence(mono, sample_rate)
+    resampled = resample(speech, sample_rate, TARGET_SAMPLE_RATE)
+    processed = float_to_pcm16(resampled) if len(speech) else b""
+
+    stats = {
+        "input_bytes": len(raw_data),
+        "output_bytes": len(processed),
+        "bytes_saved": len(raw_data) - len(processed),
+        "input_seconds": len(mono) / sample_rate if sample_rate else 0.0,
+        "output_seconds": len(resampled) / TARGET_SAMPLE_RATE if len(speech) else 0.0,
+        "speech_found": bool(len(speech)),
+        "cpu_ms": (time.thread_time() - cpu_start) * 1000.0,
+    }
+    return processed, TARGET_SAMPLE_RATE, TARGET_SAMPLE_WIDTH, stats
+
+
+# --- In-process FLAC Encoding ---
+def encode_flac(raw_data, sample_rate, sample_width):
+    """Encodes mono PCM bytes to FLAC entirely in memory. 8-bit audio is widened to 16-bit, 32-bit is narrowed to 24-bit."""
+    if sample_width == 1:
+        samples = ((np.frombuffer(raw_data, dtype=np.uint8).astype(np.int16) - 128) << 8)
+        subtype = "PCM_16"
+    elif sample_width == 2:
+        samples = np.frombuffer(raw_data, dtype="<i2")
+        subtype = "PCM_16"
+    elif sample_width == 3:
+        packed = np.frombuffer(raw_data, dtype=np.uint8).reshape(-1, 3).astype(np.int32)
+        # Place the 24-bit value in the top bytes of an int32, which is how libsndfile expects PCM_24 data.
+        samples = (packed[:, 0] << 8) | (packed[:, 1] << 16) | (packed[:, 2] << 24)
+        subtype = "PCM_24"
+    elif sample_width == 4:
+        samples = np.frombuffer(raw_data, dtype="<i4")
+        subtype = "PCM_24"
+    else:
+        raise ValueError(f"Unsupported sample width: {sample_width}")
+
+    buffer = io.BytesIO()
+    soundfile.write(buffer, samples, sample_rate, format="FLAC", subtype=subtype)
+    return buffer.getvalue()
+
+
+class InProcessFlacAudioData(sr.AudioData):
+    """
+    AudioData whose get_flac_data() encodes in-process instead of spawning the external flac converter.
+    Falls back to the stock converter when soundfile is not installed. flac_data can carry an encoding
+    made elsewhere (e.g. in a worker process); it is used when no conversion is requested.
+    """
+
+    def __init__(self, frame_data, sample_rate, sample_width, flac_data=None):
+        super().__init__(frame_data, sample_rate, sample_width)
+        self.flac_data = flac_data
+
+    def get_flac_data(self, convert_rate=None, convert_width=None):
+        if self.flac_data is not None and convert_rate in (None, self.sample_rate) and convert_width in (None, self.sample_width):
+            return self.flac_data
+        if soundfile is None:
+            return super().get_flac_data(convert_rate, convert_width)
+
+        if self.sample_width > 3 and convert_width is None:
+            convert_width = 3  # FLAC tops out at 24-bit, same rule as the stock converter
+        elif self.sample_width == 1 and convert_width is None:
+            convert_width = 2  # get_raw_data() hands back 8-bit audio already made signed; encode_flac expects WAV's unsigned bytes
+        raw_data = self.get_raw_data(convert_rate, convert_width)
+        sample_rate = self.sample_rate if convert_rate is None else convert_rate
+        sample_width = self.sample_width if convert_width is None else convert_width
+        return encode_flac(raw_data, sample_rate, sample_width)
+
+
+# --- Recorded audio kept for re-transcription ---
+class AudioSegmentStore:
+    """
+    Keeps the (preprocessed) audio of recent utterances so a part of the transcript can be re-recognized
+    without dictating it again. Bounded by total bytes; the oldest segments are dropped first.
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.segments = OrderedDict()
+        self.total_bytes = 0
+        self.ids = itertools.count(1)
+
+    def add(self, raw_data, sample_rate, sample_width):
+        """Stores one utterance and returns its segment id."""
+        with self.lock:
+            segment_id = next(self.ids)
+            self.segments[segment_id] = (raw_data, sample_rate, sample_width)
+            self.total_bytes += len(raw_data)
+            while self.total_bytes > self.max_bytes and len(self.segments) > 1:
+                _, (dropped, _, _) = self.segments.popitem(last=False)
+                self.total_bytes -= len(dropped)
+            return segment_id
+
+    def get(self, segment_id):
+        """Returns (raw_data, sample_rate, sample_width), or None if the segment was dropped."""
+        with self.lock:
+            return self.segments.get(segment_id)
+
+    def clear(self):
+        with self.lock:
+            self.segments.clear()
+            self.total_bytes = 0
@@ -0,0 +1,87 @@
+import threading
+import time
+import wave
+
+import speech_recognition as sr
+
+from audio_processing import pcm_to_float, downmix_to_mono, float_to_pcm16
+
+# --- Input sources ---
+# Every source has start(callback) -> stopper, where callback(recognizer, audio_data) is called for each
+# chunk of captured audio and stopper(wait_for_stop=True) ends the capture. This is the same contract as
+# Recognizer.listen_in_background, so MainWindow does not care where the audio comes from.
+
+
+class MicrophoneSource:
+    """Live capture from the default microphone through speech_recognition's background listener."""
+
+    def __init__(self, recognizer):
+        self.recognizer = recognizer
+
+    def start(self, callback):
+        mic = sr.Microphone()
+        # Test microphone access
+        with mic as source:
+            self.recognizer.adjust_for_ambient_noise(source, duration=0.2) # quick adjustment
+
+        return self.recognizer.listen_in_background(
+            mic,
+            callback,
+            phrase_time_limit=None # Listen indefinitely until stopped explicitly
+        )
+
+
+class WavReplaySource:
+    """
+    Replays a WAV file through the capture callback, paced like a live microphone.
+    speed=1 is real time, speed=4 is 4x faster, speed=0 delivers the whole file as fast as possible.
+    on_finished is called (from the replay thread) when the file ran out before the source was stopped.
+    """
+
+    def __init__(self, recognizer, path, speed=1.0, chunk_seconds=0.5, on_finished=None):
+        self.recognizer = recognizer
+        self.path = path
+        self.speed = speed
+        self.chunk_seconds = chunk_seconds
+        self.on_finished = on_finished
+
+    def start(self, callback):
+        wav = wave.open(self.path, 'rb')  # Open up front so a bad file is reported like a missing microphone
+        stop_event = threading.Event()
+        thread = threading.Thread(target=self._replay, args=(wav, callback, stop_event), daemon=True)
+        thread.start()
+
+        def stopper(wait_for_stop=True):
+            stop_event.set()
+            if wait_for_stop:
+                thread.join()
+
+        return stopper
+
+    def _replay(self, wav, callback, stop_event):
+        with wav:
+            channels = wav.getnchannels()
+            sample_width = wav.getsampwidth()
+            sample_rate = wav.getframerate()
+            frames_per_chunk = max(1, int(sample_rate * self.chunk_seconds))
+
+            started_at = time.perf_counter()
+            chunk_index = 0
+            while not stop_event.is_set():
+                frames = wav.readframes(frames_per_chunk)
+                if not frames:
+                    break
+                if channels > 1:  # AudioData is mono, so downmix like a mono microphone would capture it
+                    frames = float_to_pcm16(downmix_to_mono(pcm_to_float(frames, sample_width, channels)))
+                    callback(self.recognizer, sr.AudioData(frames, sample_rate, 2))
+                else:
+                    callback(self.recognizer, sr.AudioData(frames, sample_rate, sample_width))
+
+                chunk_index += 1
+                if self.speed > 0:
+                    # Pace against the start time rather than sleeping per chunk, so timing does not drift.
+                    due = started_at + chunk_index * self.chunk_seconds / self.speed
+                    stop_event.wait(max(0.0, due - time.perf_counter()))
+
+        if not stop_event.is_set() and self.on_finished:
+            self.on_finished()
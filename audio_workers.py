@@ -0,0 +1,123 @@
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+
+from audio_processing import preprocess_audio, encode_flac, soundfile, InProcessFlacAudioData
+
+# --- CPU-heavy audio work in worker processes ---
+# Preprocessing and FLAC encoding hold the GIL for long stretches, which freezes the window and delays
+# capture callbacks. They run in a small process pool instead. The captured audio is written once into
+# a shared memory block that the worker reads in place; the processed audio is written back into the
+# same block, so no large buffers are pickled in either direction.
+
+
+def _attach_shared_memory(name):
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)  # Python 3.13+
+    except TypeError:
+        # Pool workers share the parent's resource tracker, so this registration is dropped again
+        # when the parent unlinks the block.
+        return shared_memory.SharedMemory(name=name)
+
+
+def _worker_ready():
+    return True
+
+
+def prepare_shared_audio(shm_name, size, sample_rate, sample_width, preprocess):
+    """
+    Worker-process entry point. Reads PCM from shared memory, optionally preprocesses it and encodes FLAC.
+    The processed PCM is written back into the block when it fits, otherwise returned in the result.
+    """
+    shm = _attach_shared_memory(shm_name)
+    try:
+        raw_view = shm.buf[:size]
+        if preprocess:
+            processed, sample_rate, sample_width, stats = preprocess_audio(raw_view, sample_rate, sample_width)
+        else:
+            processed, stats = bytes(raw_view), None
+        raw_view.release()
+
+        flac_data = None
+        if processed and soundfile is not None and sample_width <= 3:
+            flac_data = encode_flac(processed, sample_rate, sample_width)
+
+        result = {"sample_rate": sample_rate, "sample_width": sample_width, "stats": stats,
+                  "flac_data": flac_data, "size": len(processed), "pcm": None}
+        if len(processed) <= size:
+            shm.buf[:len(processed)] = processed
+        else:
+            result["pcm"] = processed  # Only when upsampling from below 16 kHz
+        return result
+    finally:
+        shm.close()
+
+
+class AudioWorkerPool:
+    """Lazily started pool of worker processes for preparing recorded utterances."""
+
+    def __init__(self, workers=2):
+        self.workers = workers
+        self.executor = None
+        self.lock = threading.Lock()
+
+    def _get_executor(self):
+        with self.lock:
+            if self.executor is None:
+                # "spawn" everywhere: forking a process that has Qt and audio threads running is unsafe
+                self.executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+            return self.executor
+
+    def start(self):
+        """
+        Starts the worker processes ahead of the first utterance. Spawned workers re-import the main module
+        (transcriber.py with Qt and the AI clients), which takes a second or two; blocks until they are up.
+        """
+        executor = self._get_executor()
+        futures = [executor.submit(_worker_ready) for _ in range(self.workers)]
+        try:
+            for future in futures:
+                future.result()
+        except BrokenProcessPool:
+            with self.lock:
+                self.executor = None
+            raise
+
+    def prepare(self, frames, sample_rate, sample_width, preprocess=True):
+        """
+        Prepares the captured frames for recognition in a worker process.
+        Returns (InProcessFlacAudioData or None if no speech was found, preprocessing stats or None).
+        """
+        size = sum(len(frame) for frame in frames)
+        shm = shared_memory.SharedMemory(create=True, size=max(size, 1))
+        try:
+            # Copy the frames straight into shared memory; this replaces the b"".join of the old code path
+            offset = 0
+            for frame in frames:
+                shm.buf[offset:offset + len(frame)] = frame
+                offset += len(frame)
+
+            future = self._get_executor().submit(prepare_shared_audio, shm.name, size, sample_rate, sample_width, preprocess)
+            try:
+                result = future.result()
+            except BrokenProcessPool:
+                with self.lock:
+                    self.executor = None # A worker died; start a fresh pool next time
+                raise
+
+            if not result["size"]:
+                return None, result["stats"]
+            pcm = result["pcm"] if result["pcm"] is not None else bytes(shm.buf[:result["size"]])
+            audio_data = InProcessFlacAudioData(pcm, result["sample_rate"], result["sample_width"], flac_data=result["flac_data"])
+            return audio_data, result["stats"]
+        finally:
+            shm.close()
+            shm.unlink()
+
+    def shutdown(self):
+        with self.lock:
+            if self.executor is not None:
+                self.executor.shutdown(wait=False, cancel_futures=True)
+                self.executor = None
@@ -0,0 +1,105 @@
+"""
+Benchmark: full-text vs edit-operations polishing against a stub OpenAI-compatible LLM server.
+
+The stub (stub_llm.py) fixes a handful of planted typos and charges a per-token cost for prompt processing and a
+(much larger) per-token cost for generated output, like a real model. It answers with either the full
+corrected text or a JSON list of edits, depending on whether the edits instructions are in the prompt.
+
+    python benchmarks/bench_edit_polish.py [--sizes 2000 5000 10000] [--ms-per-output-token 5]
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import polishing
+from stub_llm import StubLLMServer, system_prompt_of, text_of, tokens
+
+TYPOS = {"recieve": "receive", "teh": "the", "definately": "definitely", "seperate": "separate", "occured": "occurred"}
+
+
+def make_document(size, typo_every=40):
+    """Numbered sentences (so each is unique), with a planted typo in one sentence out of typo_every."""
+    sentences = []
+    index = 0
+    typo_words = list(TYPOS)
+    while sum(len(s) + 1 for s in sentences) < size:
+        index += 1
+        if index % typo_every == 0:
+            typo = typo_words[(index // typo_every) % len(typo_words)]
+            sentences.append(f"In note {index} we {typo} the figures from the quarterly review.")
+        else:
+            sentences.append(f"In note {index} we discuss the figures from the quarterly review.")
+    return " ".join(sentences)
+
+
+def stub_answer(request):
+    """Fixes the planted typos, as the full text or as a JSON list of edits depending on the prompt."""
+    text = text_of(request)
+    if polishing.EDITS_INSTRUCTIONS not in system_prompt_of(request):
+        return expected_result(text)
+    edits = []
+    for sentence in re.split(r"(?<=\.) ", text):
+        fixed = expected_result(sentence)
+        if fixed != sentence:
+            edits.append({"find": sentence, "replace": fixed})
+    return json.dumps(edits)
+
+
+def expected_result(text):
+    for typo, correction in TYPOS.items():
+        text = re.sub(rf"\b{typo}\b", correction, text)
+    return text
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[2000, 5000, 10000], help="Document sizes in characters")
+    parser.add_argument("--ms-per-prompt-token", type=float, default=0.2)
+    parser.add_argument("--ms-per-output-token", type=float, default=5.0)
+    parser.add_argument("--typo-every", type=int, default=40, help="One typo per N sentences")
+    args = parser.parse_args()
+
+    def cost_ms(request, content):
+        prompt_tokens = tokens(system_prompt_of(request)) + tokens(text_of(request))
+        return prompt_tokens * args.ms_per_prompt_token + tokens(content) * args.ms_per_output_token
+
+    server = StubLLMServer(stub_answer, cost_ms)
+    base_settings = {
+        "ai_service": "Local",
+        "local_model_url": server.url,
+        "system_prompt": "Proofread the text.",
+    }
+
+    # Count response sizes by wrapping the one function both modes go through
+    response_sizes = []
+    original_generate = polishing._generate
+    def measuring_generate(*call_args, **call_kwargs):
+        result = original_generate(*call_args, **call_kwargs)
+        response_sizes.append(len(result))
+        return result
+    polishing._generate = measuring_generate
+
+    print(f"{'chars':>8} {'mode':<6} {'response chars':>15} {'latency ms':>11} {'correct':>8}")
+    for size in args.sizes:
+        document = make_document(size, args.typo_every)
+        results = {}
+        for mode in ("full", "edits"):
+            settings = dict(base_settings, polish_output_mode=mode)
+            response_sizes.clear()
+            start = time.perf_counter()
+            polished = polishing.polish_text_with_service(document, settings)
+            elapsed = (time.perf_counter() - start) * 1000.0
+            results[mode] = (sum(response_sizes), elapsed)
+            print(f"{len(document):>8} {mode:<6} {sum(response_sizes):>15} {elapsed:>11.1f} {str(polished == expected_result(document)):>8}")
+        print(f"{'':>8} edits vs full: {results['full'][0] / max(results['edits'][0], 1):.1f}x smaller response, "
+              f"{results['full'][1] / max(results['edits'][1], 1e-6):.1f}x faster\n")
+    server.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Measures how long the GUI event loop freezes while recorded utterances are prepared for recognition,
+with the audio worker processes enabled and with everything done on threads in the GUI process.
+
+    python benchmarks/bench_event_loop_stall.py --utterances 4 --seconds 30
+
+Runs MainWindow offscreen with a stub recognizer, hands it several long 48 kHz recordings at once and
+reports the worst lateness of a 50 ms timer on the GUI thread (EventLoopStallMonitor) per mode.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+import numpy as np
+
+REPO_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, REPO_DIR)
+
+from PySide6.QtWidgets import QApplication
+
+import transcriber
+from audio_workers import AudioWorkerPool
+
+SAMPLE_RATE = 48000
+FRAME_BYTES = 4096
+
+
+def synthetic_recording(seconds, rng):
+    """Pauses and bursts of 'speech', split into frames like the background listener delivers them."""
+    total = int(seconds * SAMPLE_RATE)
+    t = np.arange(total) / SAMPLE_RATE
+    envelope = (np.sin(2 * np.pi * 0.25 * t) > 0).astype(float)
+    signal = rng.normal(0, 0.002, total) + envelope * 0.3 * np.sin(2 * np.pi * 220 * t)
+    raw = (np.clip(signal, -1, 1) * 32767).astype("<i2").tobytes()
+    return [raw[i:i + FRAME_BYTES] for i in range(0, len(raw), FRAME_BYTES)]
+
+
+def run_mode(app, window, recordings, timeout):
+    results = []
+    on_text = lambda text, segment: results.append(text)
+    window.comm.text_ready.connect(on_text)
+    window.stall_monitor.reset()
+    started = time.perf_counter()
+    for frames in recordings:
+        window.is_recording = True
+        window.audio_frames = list(frames)
+        window.current_sample_rate = SAMPLE_RATE
+        window.current_sample_width = 2
+        window.stop_recording()
+        app.processEvents()
+    while len(results) < len(recordings) and time.perf_counter() - started < timeout:
+        app.processEvents()
+        time.sleep(0.002)
+    elapsed = time.perf_counter() - started
+    window.comm.text_ready.disconnect(on_text)
+    return {"completed": len(results), "elapsed_s": round(elapsed, 3),
+            "max_stall_ms": round(window.stall_monitor.max_stall_ms, 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--utterances", type=int, default=4, help="Recordings handed over at the same time")
+    parser.add_argument("--seconds", type=float, default=30.0, help="Length of each recording")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--timeout", type=float, default=120.0)
+    args = parser.parse_args()
+
+    os.chdir(tempfile.mkdtemp(prefix="stall_"))
+    with open("settings.json", "w") as f:
+        json.dump({"ai_service": "Light", "listen_mode": "Click and Stick", "audio_worker_processes": 0,
+                   "monitor_event_loop": True}, f)
+
+    app = QApplication.instance() or QApplication(sys.argv[:1])
+    window = transcriber.MainWindow()
+    window.show()
+    window.recognizer.recognize_google = lambda audio_data, *a, **k: (audio_data.get_flac_data(convert_width=2), "ok")[1]
+    window.show_error_message = lambda message: print(f"error: {message}")
+
+    rng = np.random.default_rng(0)
+    recordings = [synthetic_recording(args.seconds, rng) for _ in range(args.utterances)]
+    print(f"{args.utterances} x {args.seconds:.0f}s recordings at {SAMPLE_RATE} Hz")
+
+    report = {}
+    report["threads"] = run_mode(app, window, recordings, args.timeout)
+
+    window.audio_worker_pool = AudioWorkerPool(args.workers)
+    run_mode(app, window, recordings[:1], args.timeout)  # Start the worker processes outside the measurement
+    report["worker_processes"] = run_mode(app, window, recordings, args.timeout)
+
+    for mode, result in report.items():
+        print(f"{mode:>16}: {result['completed']}/{args.utterances} done in {result['elapsed_s']:.2f}s, "
+              f"max event-loop stall {result['max_stall_ms']:.0f} ms")
+
+    window.close()
+    window.deleteLater()
+    app.processEvents()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+Microbenchmark: FLAC encode time per second of audio, external `flac` process vs in-process encoding.
+
+    python benchmarks/bench_flac.py [--seconds 10] [--runs 5] [--rate 16000]
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import speech_recognition as sr
+from audio_processing import InProcessFlacAudioData, soundfile
+
+
+def synthetic_speech(seconds, sample_rate):
+    """Noise shaped by a slow syllable-rate envelope, which compresses roughly like real speech."""
+    rng = np.random.default_rng(0)
+    t = np.arange(int(seconds * sample_rate)) / sample_rate
+    envelope = 0.5 * (1 + np.sin(2 * np.pi * 4 * t))
+    signal = envelope * (0.3 * np.sin(2 * np.pi * 220 * t) + 0.05 * rng.standard_normal(len(t)))
+    return (np.clip(signal, -1, 1) * 32767).astype("<i2").tobytes()
+
+
+def time_encoder(audio_data, runs):
+    timings = []
+    size = 0
+    for _ in range(runs):
+        start = time.perf_counter()
+        flac = audio_data.get_flac_data(convert_width=2)
+        timings.append(time.perf_counter() - start)
+        size = len(flac)
+    return min(timings), sum(timings) / len(timings), size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--rate", type=int, default=16000)
+    args = parser.parse_args()
+
+    raw = synthetic_speech(args.seconds, args.rate)
+    print(f"Audio: {args.seconds:.1f}s @ {args.rate} Hz, 16-bit mono ({len(raw)} bytes), {args.runs} runs\n")
+
+    candidates = [("external flac process", sr.AudioData(raw, args.rate, 2))]
+    if soundfile is not None:
+        candidates.append(("in-process (soundfile)", InProcessFlacAudioData(raw, args.rate, 2)))
+    else:
+        print("soundfile is not installed; only the external converter is measured.\n")
+
+    print(f"{'encoder':<26}{'best ms':>10}{'mean ms':>10}{'ms per s audio':>16}{'bytes':>10}")
+    for name, audio_data in candidates:
+        try:
+            best, mean, size = time_encoder(audio_data, args.runs)
+        except OSError as e:
+            print(f"{name:<26}  unavailable: {e}")
+            continue
+        print(f"{name:<26}{best * 1000:>10.2f}{mean * 1000:>10.2f}{mean * 1000 / args.seconds:>16.3f}{size:>10}")
+
+
+if __name__ == "__main__":
+    main()
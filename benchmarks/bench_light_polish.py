@@ -0,0 +1,107 @@
+"""
+Throughput benchmark for the offline light polish, in words per second.
+
+    python benchmarks/bench_light_polish.py [--segments 2000] [--words-per-segment 15] [--runs 5]
+
+Before timing, a table of recognizer-style inputs is checked against the expected output; the exit
+status is 1 when one of them differs.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from light_polish import light_polish
+
+VOCABULARY = ("i think the model is pretty good and we should ship it next week because what "
+              "matters most is how fast people can dictate their notes into gemini or the local server").split()
+FILLERS = ["um", "uh", "hmm", "er"]
+DICTIONARY = {"gemini": "Gemini", "local server": "local server (LM Studio)", "l l m": "LLM", "open ai": "OpenAI"}
+
+EXPECTED = [
+    ("what time is it", "What time is it?"),
+    ("how do i export the notes", "How do I export the notes?"),
+    ("is the model ready", "Is the model ready?"),
+    ("can you send it tomorrow", "Can you send it tomorrow?"),
+    ("do you think so", "Do you think so?"),
+    ("does it work offline", "Does it work offline?"),
+    ("have you seen the report", "Have you seen the report?"),
+    ("is there a faster way", "Is there a faster way?"),
+    ("is what matters most", "Is what matters most."),
+    ("will do", "Will do."),
+    ("do it now", "Do it now."),
+    ("have a look at the draft", "Have a look at the draft."),
+    ("can't wait to try it", "Can't wait to try it."),
+    ("i think um the the model is good", "I think the model is good."),
+    ("that that is fine", "That that is fine."),
+    ("first point. is it done", "First point. Is it done?"),
+    ("   ", "   "),
+]
+
+# (text before the insert point, inserted text, text after it, expected insert)
+EXPECTED_IN_CONTEXT = [
+    ("We came home ", "and then we left ", "", "and then we left. "),
+    ("We came home. ", "then we left ", "", "Then we left. "),
+    ("It is ", "very ", "good.", "very "),
+    ("Notes:\n", "is it done ", "", "Is it done? "),
+    ("So ", "first. second ", "and more", "first. Second "),
+]
+
+
+def check_expected():
+    cases = [("", text, "", expected) for text, expected in EXPECTED] + EXPECTED_IN_CONTEXT
+    failures = []
+    for before, text, after, expected in cases:
+        got = light_polish(text, before=before, after=after)
+        if got != expected:
+            failures.append(f"MISMATCH {before!r} + {text!r} + {after!r}: expected {expected!r}, got {got!r}")
+    print("\n".join(failures + [f"{len(cases) - len(failures)}/{len(cases)} expected cases match\n"]))
+    return not failures
+
+
+def synthetic_segment(rng, words):
+    """Recognizer-style output: lowercase, unpunctuated, with the odd filler and stutter."""
+    out = []
+    for _ in range(words):
+        word = rng.choice(VOCABULARY)
+        roll = rng.random()
+        if roll < 0.08:
+            out.append(rng.choice(FILLERS))
+        elif roll < 0.12:
+            out.append(word)
+        out.append(word)
+    return " ".join(out) + " "
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--segments", type=int, default=2000)
+    parser.add_argument("--words-per-segment", type=int, default=15)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    if not check_expected():
+        sys.exit(1)
+
+    rng = random.Random(0)
+    segments = [synthetic_segment(rng, args.words_per_segment) for _ in range(args.segments)]
+    total_words = sum(len(s.split()) for s in segments)
+
+    print(f"{args.segments} segments, {total_words} words, {args.runs} runs")
+    print(f"Example: {segments[0]!r}\n      -> {light_polish(segments[0], DICTIONARY)!r}\n")
+
+    for label, dictionary in (("no dictionary", None), ("with dictionary", DICTIONARY)):
+        best = float("inf")
+        for _ in range(args.runs):
+            start = time.perf_counter()
+            for segment in segments:
+                light_polish(segment, dictionary)
+            best = min(best, time.perf_counter() - start)
+        print(f"{label:<16} {total_words / best:>12,.0f} words/s   {best / args.segments * 1e6:>8.1f} us/segment")
+
+
+if __name__ == "__main__":
+    main()
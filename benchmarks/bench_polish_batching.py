@@ -0,0 +1,106 @@
+"""
+Benchmark: a burst of selection polishes, one request each vs micro-batched (PolishBatcher),
+against a stub OpenAI-compatible LLM server.
+
+The stub (stub_llm.py) handles one request at a time, like a single local model, and charges a per-token cost for
+prompt prefill (system prompt included) and for generated output. It understands the batch format and
+can be told to garble it, to exercise the one-by-one fallback.
+
+    python benchmarks/bench_polish_batching.py [--burst 8] [--wait-ms 100] [--garble]
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import polishing
+from stub_llm import StubLLMServer, system_prompt_of, text_of, tokens
+SYSTEM_PROMPT = ("Your task is to act as a proofreader. You will receive a user's text. Your sole output must be the "
+                 "proofread version of the input text. Do not include any greetings, comments, questions, or "
+                 "conversational elements. Keep as close as possible to the initial user wording and meaning.")
+
+
+def fix(text):
+    text = text.strip()
+    return text[:1].upper() + text[1:] + ("" if text.endswith(".") else ".")
+
+
+def make_stub_answer(garble):
+    """Answers single texts and the batch format; garble drops the last item of a batch."""
+    def answer(request):
+        text = text_of(request)
+        if "BATCH FORMAT" not in system_prompt_of(request):
+            return fix(text)
+        items = polishing.BATCH_MARKER_PATTERN.split(text)[2::2]
+        if garble:
+            items = items[:-1]
+        return "\n".join(f"{polishing.BATCH_MARKER.format(i)}\n{fix(item)}" for i, item in enumerate(items, 1))
+    return answer
+
+
+def make_stub_cost(ms_per_prompt_token, ms_per_output_token, overhead_ms, counters):
+    def cost_ms(request, content):
+        prompt_tokens = tokens(system_prompt_of(request)) + tokens(text_of(request))
+        counters["requests"] += 1
+        counters["prompt_tokens"] += prompt_tokens
+        return overhead_ms + prompt_tokens * ms_per_prompt_token + tokens(content) * ms_per_output_token
+    return cost_ms
+
+
+def run_burst(batcher, settings, selections, spacing_ms):
+    results = [None] * len(selections)
+    latencies = [None] * len(selections)
+
+    def polish(index):
+        started = time.perf_counter()
+        results[index] = batcher.polish(selections[index], settings)
+        latencies[index] = (time.perf_counter() - started) * 1000.0
+
+    started = time.perf_counter()
+    threads = []
+    for index in range(len(selections)):
+        thread = threading.Thread(target=polish, args=(index,))
+        thread.start()
+        threads.append(thread)
+        time.sleep(spacing_ms / 1000.0)
+    for thread in threads:
+        thread.join()
+    return results, latencies, (time.perf_counter() - started) * 1000.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--burst", type=int, default=8, help="Selections polished in quick succession")
+    parser.add_argument("--spacing-ms", type=float, default=10, help="Time between the polish clicks")
+    parser.add_argument("--wait-ms", type=int, default=100, help="PolishBatcher max wait")
+    parser.add_argument("--max-items", type=int, default=8)
+    parser.add_argument("--ms-per-prompt-token", type=float, default=0.5)
+    parser.add_argument("--ms-per-output-token", type=float, default=5.0)
+    parser.add_argument("--overhead-ms", type=float, default=30.0, help="Fixed cost per request")
+    parser.add_argument("--garble", action="store_true", help="Stub drops one batch item (tests the fallback)")
+    args = parser.parse_args()
+
+    selections = [f"this is selection number {i} which has a few words that need a proofread" for i in range(args.burst)]
+    expected = [fix(s) for s in selections]
+
+    for label, wait_ms in (("one request each", 0), (f"batched ({args.wait_ms} ms window)", args.wait_ms)):
+        counters = {"requests": 0, "prompt_tokens": 0}
+        cost_ms = make_stub_cost(args.ms_per_prompt_token, args.ms_per_output_token, args.overhead_ms, counters)
+        server = StubLLMServer(make_stub_answer(args.garble), cost_ms, serial=True)  # Like a single local model
+        settings = {"ai_service": "Local", "system_prompt": SYSTEM_PROMPT, "local_model_url": server.url}
+
+        batcher = polishing.PolishBatcher(max_wait_ms=wait_ms, max_items=args.max_items)
+        results, latencies, total_ms = run_burst(batcher, settings, selections, args.spacing_ms)
+        server.close()
+
+        status = "ok" if results == expected else "WRONG RESULTS"
+        print(f"{label:>28}: {total_ms:7.0f} ms total, {counters['requests']:2d} model requests, "
+              f"{counters['prompt_tokens']:5.0f} prompt tokens, worst wait {max(latencies):6.0f} ms, "
+              f"fallbacks {batcher.stats()['fallbacks']}  [{status}]")
+
+
+if __name__ == "__main__":
+    main()
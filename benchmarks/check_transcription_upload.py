@@ -0,0 +1,160 @@
+"""
+Checks the transcription-server backend against a local stub of an OpenAI-compatible
+/v1/audio/transcriptions endpoint.
+
+    python benchmarks/check_transcription_upload.py --seconds 3 --chunk-ms 100
+
+The stub reads the request as it arrives and verifies that the streamed upload is chunked, carries the
+model field and a WAV file whose PCM matches what was captured, and that the first audio reached the
+server while "recording" was still going on. The one-shot upload (used for re-transcription and the
+serve mode) is checked as well. Exit status is 1 when a check fails.
+"""
+import argparse
+import json
+import os
+import struct
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+REPO_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, REPO_DIR)
+
+import speech_recognition as sr
+
+from recognition import StreamingTranscription, WAV_UNKNOWN_SIZE, recognize_audio_data
+
+SAMPLE_RATE = 16000
+SAMPLE_WIDTH = 2
+
+
+# --- Stub transcription server ---
+class StubTranscriptionHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    requests_seen = []
+
+    def log_message(self, format, *args):
+        pass
+
+    def _read_chunked(self, record):
+        body = bytearray()
+        while True:
+            size = int(self.rfile.readline().split(b";")[0].strip(), 16)
+            if size == 0:
+                self.rfile.readline()
+                return bytes(body)
+            body += self.rfile.read(size)
+            self.rfile.readline()
+            record["chunk_times"].append(time.perf_counter())
+
+    def do_POST(self):
+        record = {"path": self.path, "headers": dict(self.headers), "chunk_times": [], "received_at": time.perf_counter()}
+        if self.headers.get("Transfer-Encoding", "").lower() == "chunked":
+            body = self._read_chunked(record)
+        else:
+            body = self.rfile.read(int(self.headers["Content-Length"]))
+        record["body"] = body
+        self.requests_seen.append(record)
+
+        payload = json.dumps({"text": f"heard {len(body)} bytes"}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+def parse_multipart(record):
+    boundary = record["headers"]["Content-Type"].split("boundary=", 1)[1].encode()
+    parts = {}
+    for part in record["body"].split(b"--" + boundary)[1:-1]:
+        head, _, content = part.strip(b"\r\n").partition(b"\r\n\r\n")
+        name = head.split(b'name="', 1)[1].split(b'"', 1)[0].decode()
+        parts[name] = content
+    return parts
+
+
+# --- Checks ---
+def check_request(record, expected_pcm, model, streamed, failures):
+    label = "streamed" if streamed else "one-shot"
+    if record["path"] != "/v1/audio/transcriptions":
+        failures.append(f"{label}: unexpected path {record['path']}")
+    chunked = record["headers"].get("Transfer-Encoding", "").lower() == "chunked"
+    if chunked != streamed:
+        failures.append(f"{label}: Transfer-Encoding chunked={chunked}")
+
+    parts = parse_multipart(record)
+    if parts.get("model", b"").decode() != model:
+        failures.append(f"{label}: model field is {parts.get('model')!r}")
+    wav = parts.get("file", b"")
+    if wav[:4] != b"RIFF" or wav[8:12] != b"WAVE":
+        failures.append(f"{label}: file part is not a WAV file")
+        return
+    channels, rate, _, _, bits = struct.unpack("<HIIHH", wav[22:36])
+    data_size = struct.unpack("<I", wav[40:44])[0]
+    if (channels, rate, bits) != (1, SAMPLE_RATE, SAMPLE_WIDTH * 8):
+        failures.append(f"{label}: WAV format {channels}ch {rate} Hz {bits}-bit")
+    if data_size != (WAV_UNKNOWN_SIZE if streamed else len(expected_pcm)):
+        failures.append(f"{label}: WAV data size field {data_size:#x}")
+    if wav[44:] != expected_pcm:
+        failures.append(f"{label}: PCM differs ({len(wav) - 44} bytes received, {len(expected_pcm)} sent)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=float, default=3.0, help="Length of the simulated recording")
+    parser.add_argument("--chunk-ms", type=int, default=100, help="Capture chunk length, fed in real time")
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubTranscriptionHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    settings = {
+        "speech_service": "Transcription Server",
+        "local_transcription_url": f"http://127.0.0.1:{server.server_address[1]}/v1/audio/transcriptions",
+        "local_transcription_model": "stub-whisper",
+    }
+
+    rng = np.random.default_rng(0)
+    pcm = (rng.normal(0, 0.1, int(args.seconds * SAMPLE_RATE)) * 32767).astype("<i2").tobytes()
+    chunk_bytes = SAMPLE_RATE * SAMPLE_WIDTH * args.chunk_ms // 1000
+    failures = []
+
+    # Streamed: chunks are fed at capture pace, as the microphone callback would
+    upload = StreamingTranscription(settings, SAMPLE_RATE, SAMPLE_WIDTH)
+    for offset in range(0, len(pcm), chunk_bytes):
+        upload.feed(pcm[offset:offset + chunk_bytes])
+        time.sleep(args.chunk_ms / 1000)
+    recording_stopped = time.perf_counter()
+    text = upload.finish(timeout=30)
+    answered = time.perf_counter()
+
+    record = StubTranscriptionHandler.requests_seen[-1]
+    check_request(record, pcm, settings["local_transcription_model"], True, failures)
+    if not text.startswith("heard"):
+        failures.append(f"streamed: unexpected text {text!r}")
+    audio_before_stop = sum(1 for t in record["chunk_times"] if t < recording_stopped)
+    if audio_before_stop < 2:
+        failures.append("streamed: upload did not overlap with capture")
+    print(f"streamed: {len(record['chunk_times'])} chunks, {audio_before_stop} arrived before recording stopped, "
+          f"answer {1000 * (answered - recording_stopped):.1f} ms after stop")
+
+    # One-shot: the complete utterance in a single request with a known length
+    started = time.perf_counter()
+    text = recognize_audio_data(sr.Recognizer(), sr.AudioData(pcm, SAMPLE_RATE, SAMPLE_WIDTH), settings)
+    check_request(StubTranscriptionHandler.requests_seen[-1], pcm, settings["local_transcription_model"], False, failures)
+    print(f"one-shot: upload and answer {1000 * (time.perf_counter() - started):.1f} ms after stop")
+
+    server.shutdown()
+    if failures:
+        print("\nCHECK FAILED:")
+        for failure in failures:
+            print(f"  - {failure}")
+        sys.exit(1)
+    print("\nAll transcription upload checks passed.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,293 @@
+"""
+Long-session soak test: drives MainWindow offscreen through dictate/polish/clear/save cycles with
+synthetic audio and stub backends, samples memory/threads/Qt objects/latency on a schedule and
+fails if growth or latency drift exceeds the budgets.
+
+    python benchmarks/soak.py --duration 14400 --sample-every 60 --report soak_report.json
+
+Exit status is 1 when a budget is exceeded. The tracemalloc diff at the end lists the top allocators
+between the baseline (taken after warm-up) and the final sample.
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+import numpy as np
+
+REPO_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, REPO_DIR)
+
+import speech_recognition as sr
+from PySide6.QtCore import QObject
+from PySide6.QtWidgets import QApplication, QFileDialog
+
+import polishing
+import transcriber
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+SAMPLE_RATE = 44100
+WORDS = "the quick brown fox jumps over the lazy dog while we keep talking about nothing much".split()
+
+
+# --- Process metrics ---
+def rss_mb():
+    if psutil is not None:
+        return psutil.Process().memory_info().rss / (1024 * 1024)
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource  # Peak rather than current RSS, but still shows growth
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def qt_object_count(window):
+    return len(window.findChildren(QObject)) + len(QApplication.allWidgets())
+
+
+# --- Synthetic audio and stub backends ---
+def synthetic_utterance(seconds, rng):
+    """Silence, a burst of 'speech' and silence again, like a press-and-release recording."""
+    total = int(seconds * SAMPLE_RATE)
+    signal = rng.normal(0, 0.002, total)
+    start, end = int(total * 0.2), int(total * 0.8)
+    t = np.arange(end - start) / SAMPLE_RATE
+    signal[start:end] += 0.3 * np.sin(2 * np.pi * 220 * t) * (0.5 + 0.5 * np.sin(2 * np.pi * 4 * t))
+    return (np.clip(signal, -1, 1) * 32767).astype("<i2").tobytes()
+
+
+def make_stub_recognizer(latency_s, rng):
+    def recognize_google(audio_data, *args, **kwargs):
+        audio_data.get_flac_data(convert_width=2)  # exercise the real encoder
+        time.sleep(latency_s)
+        return " ".join(rng.choice(WORDS, size=8))
+    return recognize_google
+
+
+def make_stub_polisher(latency_s):
+    def polish_text_with_service(text, settings):
+        time.sleep(latency_s)
+        return text.capitalize() + "."
+    return polish_text_with_service
+
+
+# --- Driver ---
+class SoakDriver:
+    def __init__(self, app, window, args):
+        self.app = app
+        self.window = window
+        self.args = args
+        self.rng = np.random.default_rng(args.seed)
+        self.latencies = {"dictate": [], "polish": [], "clear": [], "save": []}
+        self.errors = []
+        self.save_counter = 0
+
+    def pump_until(self, condition, timeout):
+        deadline = time.perf_counter() + timeout
+        while time.perf_counter() < deadline:
+            self.app.processEvents()
+            if condition():
+                return True
+            time.sleep(0.001)
+        return False
+
+    def dictate(self):
+        window = self.window
+        raw_area = window.raw_text_area
+        before = len(raw_area.toPlainText())
+        audio = synthetic_utterance(self.args.utterance_seconds, self.rng)
+        chunk = SAMPLE_RATE  # bytes, i.e. half-second 16-bit phrases as listen_in_background would deliver them
+
+        window.is_recording = True
+        window.audio_frames = []
+        window.current_sample_rate = None
+        window.current_sample_width = None
+        window.background_listen_stop_handle = lambda wait_for_stop=True: None
+
+        def feed():
+            for offset in range(0, len(audio), chunk):
+                window.audio_accumulation_callback(window.recognizer, sr.AudioData(audio[offset:offset + chunk], SAMPLE_RATE, 2))
+        feeder = threading.Thread(target=feed)
+        feeder.start()
+        feeder.join()
+
+        start = time.perf_counter()
+        window.stop_recording()
+        if not self.pump_until(lambda: len(raw_area.toPlainText()) > before, self.args.op_timeout):
+            self.errors.append("dictate timed out")
+            return
+        self.latencies["dictate"].append((time.perf_counter() - start) * 1000.0)
+
+    def polish(self):
+        polished_area = self.window.polished_text_area
+        before = len(polished_area.toPlainText())
+        start = time.perf_counter()
+        self.window.polish_text()
+        if not self.pump_until(lambda: len(polished_area.toPlainText()) > before, self.args.op_timeout):
+            self.errors.append("polish timed out")
+            return
+        self.latencies["polish"].append((time.perf_counter() - start) * 1000.0)
+
+    def clear(self):
+        start = time.perf_counter()
+        self.window.clear_all_text()
+        self.app.processEvents()
+        self.latencies["clear"].append((time.perf_counter() - start) * 1000.0)
+
+    def save(self):
+        self.save_counter += 1
+        filename = os.path.join(self.window.savings_dir, f"soak_{self.save_counter % 10}.json")
+        QFileDialog.getSaveFileName = staticmethod(lambda *args, **kwargs: (filename, "JSON Files (*.json)"))
+        start = time.perf_counter()
+        self.window.save_and_new()
+        self.app.processEvents()
+        self.latencies["save"].append((time.perf_counter() - start) * 1000.0)
+
+    def cycle(self, index):
+        for _ in range(self.args.dictations_per_cycle):
+            self.dictate()
+        self.polish()
+        if index % self.args.save_every == 0:
+            self.save()
+        else:
+            self.clear()
+
+
+def take_sample(driver, elapsed):
+    sample = {
+        "elapsed_s": round(elapsed, 1),
+        "rss_mb": round(rss_mb(), 2),
+        "threads": threading.active_count(),
+        "qt_objects": qt_object_count(driver.window),
+        "traced_mb": round(tracemalloc.get_traced_memory()[0] / (1024 * 1024), 2),
+    }
+    for name, values in driver.latencies.items():
+        sample[f"{name}_p50_ms"] = round(statistics.median(values), 2) if values else None
+        values.clear()
+    return sample
+
+
+def check_budgets(baseline, final, args):
+    failures = []
+    if final["rss_mb"] - baseline["rss_mb"] > args.max_rss_growth_mb:
+        failures.append(f"RSS grew {final['rss_mb'] - baseline['rss_mb']:.1f} MB (budget {args.max_rss_growth_mb} MB)")
+    if final["threads"] - baseline["threads"] > args.max_thread_growth:
+        failures.append(f"Thread count grew {final['threads'] - baseline['threads']} (budget {args.max_thread_growth})")
+    if final["qt_objects"] - baseline["qt_objects"] > args.max_qobject_growth:
+        failures.append(f"Qt object count grew {final['qt_objects'] - baseline['qt_objects']} (budget {args.max_qobject_growth})")
+    for op in ("dictate", "polish", "clear", "save"):
+        first, last = baseline.get(f"{op}_p50_ms"), final.get(f"{op}_p50_ms")
+        # Sub-millisecond operations are dominated by noise; only judge drift above a floor.
+        if first and last and last > args.latency_floor_ms and last / max(first, args.latency_floor_ms) > args.max_latency_drift:
+            failures.append(f"{op} p50 latency drifted {first:.1f} -> {last:.1f} ms (budget x{args.max_latency_drift})")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--duration", type=float, default=600, help="Seconds to run (use hours for a real soak)")
+    parser.add_argument("--sample-every", type=float, default=30, help="Seconds between samples")
+    parser.add_argument("--warmup-cycles", type=int, default=5)
+    parser.add_argument("--dictations-per-cycle", type=int, default=3)
+    parser.add_argument("--save-every", type=int, default=5, help="Save & New every N cycles, Clear All otherwise")
+    parser.add_argument("--utterance-seconds", type=float, default=2.0)
+    parser.add_argument("--recognizer-latency", type=float, default=0.02)
+    parser.add_argument("--polish-latency", type=float, default=0.02)
+    parser.add_argument("--op-timeout", type=float, default=10.0)
+    parser.add_argument("--max-rss-growth-mb", type=float, default=50.0)
+    parser.add_argument("--max-thread-growth", type=int, default=4)
+    parser.add_argument("--max-qobject-growth", type=int, default=100)
+    parser.add_argument("--max-latency-drift", type=float, default=1.5, help="Allowed ratio of final to baseline p50")
+    parser.add_argument("--latency-floor-ms", type=float, default=5.0)
+    parser.add_argument("--tracemalloc-frames", type=int, default=10)
+    parser.add_argument("--top-allocators", type=int, default=15)
+    parser.add_argument("--report", help="Write samples, failures and top allocators to this JSON file")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    report_path = os.path.abspath(args.report) if args.report else None
+    workdir = tempfile.mkdtemp(prefix="soak_")
+    os.chdir(workdir)  # MainWindow keeps settings.json and savings/ relative to the working directory
+    with open("settings.json", "w") as f:
+        json.dump({"ai_service": "Local", "listen_mode": "Click and Stick", "warm_up_model": False}, f)
+
+    tracemalloc.start(args.tracemalloc_frames)
+    app = QApplication.instance() or QApplication(sys.argv[:1])
+    window = transcriber.MainWindow()
+    window.show()
+
+    driver = SoakDriver(app, window, args)
+    window.recognizer.recognize_google = make_stub_recognizer(args.recognizer_latency, driver.rng)
+    polishing.polish_text_with_service = make_stub_polisher(args.polish_latency)
+    transcriber.pyperclip.copy = lambda text: None  # no clipboard on headless machines
+    window.show_error_message = lambda message: driver.errors.append(message)
+
+    for index in range(args.warmup_cycles):
+        driver.cycle(index + 1)
+    baseline = take_sample(driver, 0.0)
+    baseline_snapshot = tracemalloc.take_snapshot()
+    samples = [baseline]
+    print(f"Baseline: {json.dumps(baseline)}")
+
+    start = time.perf_counter()
+    next_sample = start + args.sample_every
+    cycle_index = args.warmup_cycles
+    while time.perf_counter() - start < args.duration:
+        cycle_index += 1
+        driver.cycle(cycle_index)
+        if time.perf_counter() >= next_sample:
+            samples.append(take_sample(driver, time.perf_counter() - start))
+            print(json.dumps(samples[-1]))
+            next_sample += args.sample_every
+    if len(samples) == 1 or any(driver.latencies.values()):
+        samples.append(take_sample(driver, time.perf_counter() - start))
+        print(json.dumps(samples[-1]))
+
+    final = samples[-1]
+    # Latency for the final comparison comes from the last sample that actually measured it.
+    for key in baseline:
+        if key.endswith("_p50_ms") and final.get(key) is None:
+            final[key] = next((s[key] for s in reversed(samples) if s.get(key) is not None), None)
+
+    final_snapshot = tracemalloc.take_snapshot()
+    top_allocators = [str(stat) for stat in final_snapshot.compare_to(baseline_snapshot, "lineno")[:args.top_allocators]]
+    print(f"\nTop allocators since baseline ({cycle_index - args.warmup_cycles} cycles):")
+    for line in top_allocators:
+        print(f"  {line}")
+
+    failures = check_budgets(baseline, final, args)
+    if driver.errors:
+        failures.append(f"{len(driver.errors)} operation errors, first: {driver.errors[0]}")
+
+    if report_path:
+        with open(report_path, "w") as f:
+            json.dump({"samples": samples, "failures": failures, "top_allocators": top_allocators}, f, indent=4)
+
+    window.close()
+    window.deleteLater()
+    app.processEvents()
+    if failures:
+        print("\nSOAK FAILED:")
+        for failure in failures:
+            print(f"  - {failure}")
+        sys.exit(1)
+    print("\nSoak passed: all budgets held.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Stub OpenAI-compatible /v1/chat/completions server shared by the polishing benchmarks.
+
+Each benchmark passes its own answer function (request JSON -> reply text) and cost function
+(request JSON, reply text -> milliseconds to sleep before answering), so the stub behaves like
+whatever model the benchmark needs:
+
+    with StubLLMServer(answer, cost_ms, serial=True) as server:
+        settings = {"ai_service": "Local", "local_model_url": server.url, ...}
+"""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CHARS_PER_TOKEN = 4
+
+
+def tokens(text):
+    """Rough token count of a text, the same rule everywhere in the benchmarks."""
+    return len(text) / CHARS_PER_TOKEN
+
+
+def system_prompt_of(request):
+    return request["messages"][0]["content"]
+
+
+def text_of(request):
+    return request["messages"][-1]["content"]
+
+
+class StubLLMServer:
+    """
+    Runs on a free local port in a background thread. cost_ms is called under one lock, so it can keep
+    state (a loaded model, a prompt cache, counters). With serial=True the sleep happens under that lock
+    too, i.e. requests are processed one at a time like a single local model.
+    """
+
+    def __init__(self, answer, cost_ms=None, serial=False):
+        self.answer = answer
+        self.cost_ms = cost_ms or (lambda request, content: 0.0)
+        self.serial = serial
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self._make_handler())
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/v1/chat/completions"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def _respond(self, request):
+        content = self.answer(request)
+        with self.lock:
+            delay_ms = self.cost_ms(request, content)
+            if self.serial:
+                time.sleep(delay_ms / 1000.0)
+        if not self.serial:
+            time.sleep(delay_ms / 1000.0)
+        return content
+
+    def _make_handler(self):
+        stub = self
+
+        class StubLLMHandler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def do_POST(self):
+                request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                content = stub._respond(request)
+                body = json.dumps({"choices": [{"message": {"content": content}}]}).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        return StubLLMHandler
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
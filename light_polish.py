@@ -0,0 +1,119 @@
+import re
+from functools import lru_cache
+
+# --- Light polish: fast, offline clean-up of raw recognizer output ---
+# Google's recognizer returns lowercase text without punctuation. These rules fix the obvious things
+# (fillers, stutters, "i", sentence casing, final punctuation) in well under a millisecond per segment,
+# leaving real rewriting to the AI services.
+
+FILLER_PATTERN = re.compile(r"\b(?:u+m+|u+h+|e+r+m*|a+h+|h+m+|m+h*m+)\b[,.]?\s*", re.IGNORECASE)
+
+# "that that" and "had had" are often correct English, so they are never collapsed
+REPEATED_WORD_PATTERN = re.compile(r"\b(?!(?:that|had)\b)(\w+)(?:\s+\1\b)+", re.IGNORECASE)
+
+PRONOUN_I_PATTERN = re.compile(r"\bi(?=\b|'(?:m|ve|ll|d|s)\b)")
+SPACE_BEFORE_PUNCTUATION_PATTERN = re.compile(r"\s+([,.!?;:])")
+MULTIPLE_SPACES_PATTERN = re.compile(r"[ \t]{2,}")
+SENTENCE_SPLIT_PATTERN = re.compile(r"(?<=[.!?])\s+")
+
+QUESTION_WORDS = {"who", "what", "when", "where", "why", "how", "which", "whose", "whom"}
+
+# An auxiliary only opens a question when a subject follows it: "is the model ready" but not
+# "is what matters", "will do" or "have a look"
+AUXILIARIES = {
+    "is", "are", "am", "was", "were", "do", "does", "did", "can", "could", "would", "will",
+    "should", "shall", "may", "might", "have", "has", "isn't", "aren't", "wasn't", "weren't",
+    "don't", "doesn't", "didn't", "can't", "couldn't", "won't", "wouldn't", "shouldn't", "haven't", "hasn't",
+}
+SUBJECT_PRONOUNS = {"i", "you", "he", "she", "it", "we", "they", "there", "anyone", "anybody", "someone",
+                    "somebody", "everyone", "everybody", "anything", "something", "everything"}
+DETERMINERS = {"the", "a", "an", "this", "that", "these", "those", "my", "your", "his", "her", "its", "our",
+               "their", "any", "some", "all", "every", "each"}
+# "do" and "have" are also imperatives ("do it now", "have a look"), so they need a personal subject
+IMPERATIVE_AUXILIARIES = {"do", "have"}
+IMPERATIVE_OBJECTS = {"it", "anything", "something", "everything"}
+
+
+def _is_question(words):
+    first = words[0]
+    if first in QUESTION_WORDS:
+        return True
+    if first not in AUXILIARIES or len(words) < 2:
+        return False
+    second = words[1]
+    if first in IMPERATIVE_AUXILIARIES:
+        return second in SUBJECT_PRONOUNS and second not in IMPERATIVE_OBJECTS
+    return second in SUBJECT_PRONOUNS or second in DETERMINERS
+
+
+@lru_cache(maxsize=8)
+def _dictionary_pattern(entries):
+    if not entries:
+        return None, {}
+    replacements = {spoken.lower(): written for spoken, written in entries}
+    # Longest phrases first so "open ai" wins over "ai"
+    alternatives = sorted(replacements, key=len, reverse=True)
+    pattern = re.compile(r"\b(?:" + "|".join(re.escape(a) for a in alternatives) + r")\b", re.IGNORECASE)
+    return pattern, replacements
+
+
+def apply_dictionary(text, dictionary):
+    """Replaces spoken forms with the user's preferred spelling, e.g. {"gemini": "Gemini", "l l m": "LLM"}."""
+    if not dictionary:
+        return text
+    pattern, replacements = _dictionary_pattern(tuple(sorted(dictionary.items())))
+    return pattern.sub(lambda m: replacements[m.group(0).lower()], text)
+
+
+def _finish_sentence(sentence, capitalize=True, punctuate=True):
+    sentence = sentence.strip()
+    if not sentence:
+        return sentence
+    if capitalize:
+        sentence = sentence[0].upper() + sentence[1:]
+    if not punctuate:
+        return sentence
+    if sentence[-1] not in ".!?…:;":
+        words = [word.lower().strip(",") for word in sentence.split(None, 2)[:2]]
+        sentence += "?" if _is_question(words) else "."
+    elif sentence[-1] in ":;":
+        sentence = sentence[:-1] + "."
+    return sentence
+
+
+def _polish_line(line, capitalize=True, punctuate=True):
+    """capitalize/punctuate apply to the line's first and last sentence; the ones in between are always finished."""
+    line = FILLER_PATTERN.sub("", line)
+    line = REPEATED_WORD_PATTERN.sub(r"\1", line)
+    line = PRONOUN_I_PATTERN.sub("I", line)
+    line = SPACE_BEFORE_PUNCTUATION_PATTERN.sub(r"\1", line)
+    line = MULTIPLE_SPACES_PATTERN.sub(" ", line).strip()
+    if not line:
+        return line
+    sentences = SENTENCE_SPLIT_PATTERN.split(line)
+    last = len(sentences) - 1
+    return " ".join(_finish_sentence(s, capitalize or i > 0, punctuate or i < last) for i, s in enumerate(sentences))
+
+
+def _ends_sentence(before):
+    before = before.rstrip(" \t")
+    return not before or before[-1] in "\n.!?…"
+
+
+def light_polish(text, dictionary=None, before="", after=""):
+    """
+    Removes fillers and stutters, applies the user dictionary, fixes casing and end punctuation. Keeps surrounding whitespace.
+
+    before/after are the text around the insert point on the same line: the first word is only capitalized
+    after the end of a sentence, and no end punctuation is added when more text follows.
+    """
+    if not text.strip():
+        return text
+    leading = text[:len(text) - len(text.lstrip())]
+    trailing = text[len(text.rstrip()):]
+    lines = apply_dictionary(text.strip(), dictionary).split("\n")
+    capitalize = _ends_sentence(before + leading)
+    punctuate = not after.split("\n", 1)[0].strip() or "\n" in trailing
+    last = len(lines) - 1
+    return leading + "\n".join(_polish_line(line, capitalize or i > 0, punctuate or i < last)
+                                for i, line in enumerate(lines)) + trailing
@@ -0,0 +1,508 @@
+import json
+import re
+import statistics
+import threading
+import time
+from collections import OrderedDict, deque
+
+import google.generativeai as genai
+import requests
+from requests.adapters import HTTPAdapter
+
+from light_polish import light_polish
+
+GEMINI_MODEL_NAME = 'gemini-1.5-flash'
+LOCAL_MODEL_NAME = "local-model"
+
+# --- Edit-operations output mode ---
+# Instead of re-emitting the whole text, the model lists only what it changes; the edits are applied
+# locally. Output tokens dominate latency, so on long, lightly edited texts this is much faster.
+EDITS_MIN_CHARS = 300  # Below this the full text is about as short as a list of edits
+EDITS_INSTRUCTIONS = (
+    "OUTPUT FORMAT: Do not repeat the text. Respond only with a JSON array of the changes you would make, "
+    'for example [{"find": "their going too", "replace": "they\'re going to"}]. '
+    '"find" must be copied exactly, character for character, from the input text and must be long enough '
+    "to occur only once in it (include neighbouring words if needed). Keep each change as small as possible. "
+    "If nothing needs to change, respond with []."
+)
+
+# --- Batched polishing ---
+# Polish requests that arrive close together are sent as one request: one system prompt, one round
+# trip and one prompt prefill for the whole burst. The items are numbered and split back out.
+BATCH_MARKER = "<<<{}>>>"
+BATCH_MARKER_PATTERN = re.compile(r"^[ \t]*<<<(\d+)>>>[ \t]*$", re.MULTILINE)
+BATCH_INSTRUCTIONS = (
+    "BATCH FORMAT: The input contains {count} separate texts. Each starts on a line containing only a marker "
+    "such as <<<1>>>. Treat every text on its own, exactly as you would a single input. Respond with the same "
+    "marker lines in the same order, each followed only by your output for that text. Never merge, drop, "
+    "reorder or add texts or markers."
+)
+
+# --- Pooled clients, shared by the GUI and the serve mode ---
+# One keep-alive HTTP pool for the local model server instead of a new connection per polish.
+http_session = requests.Session()
+http_session.mount("http://", HTTPAdapter(pool_connections=4, pool_maxsize=16))
+http_session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=16))
+
+# genai.configure() is process-wide, so Gemini models are built once per API key and system prompt and reused.
+# The system prompt goes in as system_instruction rather than being pasted in front of every text.
+_gemini_lock = threading.Lock()
+_gemini_models = {}  # (api_key, system_prompt) -> model
+_gemini_api_key = None
+
+
+def get_gemini_model(api_key, system_prompt=None):
+    global _gemini_api_key
+    with _gemini_lock:
+        if api_key != _gemini_api_key:
+            genai.configure(api_key=api_key)
+            _gemini_models.clear()  # Only the current key is worth keeping
+            _gemini_api_key = api_key
+        model = _gemini_models.get((api_key, system_prompt))
+        if model is None:
+            model = genai.GenerativeModel(GEMINI_MODEL_NAME, system_instruction=system_prompt or None)
+            _gemini_models[(api_key, system_prompt)] = model
+            while len(_gemini_models) > 8: # Prompt variants: plain, edits, batches of different sizes
+                _gemini_models.pop(next(iter(_gemini_models)))
+        return model
+
+
+def _local_request_data(text, settings, stream=False, system_prompt=None, temperature=0.7):
+    data = {
+        "model": LOCAL_MODEL_NAME,
+        "messages": [
+            # The system prompt always comes first and unchanged, so servers can reuse its processed prefix
+            {"role": "system", "content": system_prompt or settings['system_prompt']},
+            {"role": "user", "content": text}
+        ],
+        "temperature": temperature,
+        "cache_prompt": True  # llama.cpp server: keep the prompt's KV cache for the next request; others ignore it
+    }
+    if stream:
+        data["stream"] = True
+    return data
+
+
+def _generate(text, settings, system_prompt, temperature=None):
+    """
+    One round trip to the configured LLM service (Gemini or Local); returns the raw response text.
+    Without a temperature, Gemini uses its own default and the local server gets 0.7.
+    """
+    start = time.perf_counter()
+    if settings.get("ai_service", "Gemini") == "Gemini":
+        model = get_gemini_model(settings['api_key'], system_prompt)
+        generation_config = {"temperature": temperature} if temperature is not None else None
+        response_text = model.generate_content(text, generation_config=generation_config).text
+    else: # Local AI
+        headers = {"Content-Type": "application/json"}
+        data = _local_request_data(text, settings, system_prompt=system_prompt,
+                                   temperature=0.7 if temperature is None else temperature)
+        response = http_session.post(settings.get("local_model_url"), headers=headers, data=json.dumps(data))
+        response.raise_for_status()
+        response_text = response.json()['choices'][0]['message']['content']
+    polish_latency.record(settings, (time.perf_counter() - start) * 1000.0)
+    return response_text
+
+
+# --- Warm-up and first-polish latency ---
+def backend_key(settings):
+    """Identifies the model endpoint a polish goes to; warm-up and latency stats are kept per backend."""
+    service = settings.get("ai_service", "Gemini")
+    if service == "Gemini":
+        return (service, settings.get("api_key"))
+    if service == "Local":
+        return (service, settings.get("local_model_url"))
+    return (service,)
+
+
+class PolishLatencyStats:
+    """
+    Model round-trip latency per backend, with the first request to each backend kept apart from the
+    steady state, plus how long the warm-up took.
+    """
+
+    MAX_SAMPLES = 200
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.backends = {}
+
+    def _entry(self, key):
+        return self.backends.setdefault(key, {"warm_up_ms": None, "first_ms": None, "steady_ms": deque(maxlen=self.MAX_SAMPLES)})
+
+    def record_warm_up(self, settings, latency_ms):
+        with self.lock:
+            self._entry(backend_key(settings))["warm_up_ms"] = latency_ms
+
+    def record(self, settings, latency_ms):
+        key = backend_key(settings)
+        with self.lock:
+            entry = self._entry(key)
+            if entry["first_ms"] is None:
+                entry["first_ms"] = latency_ms
+                warm_up = f"after a {entry['warm_up_ms']:.0f} ms warm-up" if entry["warm_up_ms"] is not None else "without warm-up"
+                print(f"DEBUG: First polish on {key[0]} took {latency_ms:.0f} ms ({warm_up}).")
+            else:
+                entry["steady_ms"].append(latency_ms)
+
+    def report(self):
+        with self.lock:
+            report = {}
+            for key, entry in self.backends.items():
+                steady = sorted(entry["steady_ms"])
+                label = f"Local ({key[1]})" if key[0] == "Local" else key[0]  # Never show the API key
+                report[label] = {
+                    "warm_up_ms": _round(entry["warm_up_ms"]),
+                    "first_polish_ms": _round(entry["first_ms"]),
+                    "steady_polishes": len(steady),
+                    "steady_p50_ms": _round(statistics.median(steady)) if steady else None,
+                    "steady_max_ms": _round(steady[-1]) if steady else None,
+                }
+            return report
+
+
+def _round(value):
+    return None if value is None else round(value, 1)
+
+
+polish_latency = PolishLatencyStats()
+
+
+def warm_up_backend(settings):
+    """
+    Gets the configured model ready before the first polish: builds the Gemini client and opens its
+    connection, or has the local server load the model and process the system prompt, which
+    cache_prompt keeps for the next request. Returns the time taken in ms.
+    """
+    service = settings.get("ai_service", "Gemini")
+    if service == "Light":
+        return 0.0
+    start = time.perf_counter()
+    if service == "Gemini":
+        model = get_gemini_model(settings['api_key'], settings['system_prompt'])
+        model.generate_content(".", generation_config={"max_output_tokens": 1}) # Opens the connection
+    else: # Local AI
+        data = _local_request_data(".", settings)
+        data["max_tokens"] = 1
+        response = http_session.post(settings.get("local_model_url"), headers={"Content-Type": "application/json"}, data=json.dumps(data))
+        response.raise_for_status()
+    latency_ms = (time.perf_counter() - start) * 1000.0
+    polish_latency.record_warm_up(settings, latency_ms)
+    return latency_ms
+
+
+def polish_text_with_service(text, settings):
+    """Sends text to the configured AI service and returns the polished text."""
+    if settings.get("ai_service", "Gemini") == "Light":
+        return light_polish(text, settings.get("light_polish_dictionary"))
+
+    if settings.get("polish_output_mode", "full") == "edits" and len(text) >= EDITS_MIN_CHARS:
+        try:
+            return polish_text_with_edits(text, settings)
+        except EditOpsError as e:
+            print(f"DEBUG: Edit-operations polish failed ({e}); falling back to full-text output.")
+
+    return _generate(text, settings, settings['system_prompt'])
+
+
+class EditOpsError(ValueError):
+    """The model's list of edits could not be parsed or does not apply cleanly to the text."""
+
+
+def parse_edit_ops(response_text):
+    """Extracts the JSON list of {"find", "replace"} edits from a model response (tolerating code fences and chatter)."""
+    cleaned = re.sub(r"^```(?:json)?\s*|\s*```$", "", response_text.strip())
+    start, end = cleaned.find("["), cleaned.rfind("]")
+    if start == -1 or end < start:
+        raise EditOpsError("response contains no JSON array")
+    try:
+        edits = json.loads(cleaned[start:end + 1])
+    except json.JSONDecodeError as e:
+        raise EditOpsError(f"invalid JSON: {e}")
+
+    for edit in edits:
+        if not isinstance(edit, dict) or not isinstance(edit.get("find"), str) or not isinstance(edit.get("replace"), str):
+            raise EditOpsError(f"malformed edit: {edit!r}")
+        if not edit["find"]:
+            raise EditOpsError("edit with an empty 'find'")
+    return edits
+
+
+def apply_edit_ops(text, edits):
+    """Applies find/replace edits to text. Every 'find' must occur exactly once and edits must not overlap."""
+    replacements = []
+    for edit in edits:
+        find = edit["find"]
+        position = text.find(find)
+        if position == -1:
+            raise EditOpsError(f"'find' not in text: {find[:60]!r}")
+        if text.find(find, position + 1) != -1:
+            raise EditOpsError(f"'find' is ambiguous: {find[:60]!r}")
+        replacements.append((position, position + len(find), edit["replace"]))
+
+    replacements.sort()
+    for (_, previous_end, _), (next_start, _, _) in zip(replacements, replacements[1:]):
+        if next_start < previous_end:
+            raise EditOpsError("edits overlap")
+
+    parts = []
+    position = 0
+    for start, end, replacement in replacements:
+        parts.append(text[position:start])
+        parts.append(replacement)
+        position = end
+    parts.append(text[position:])
+    return "".join(parts)
+
+
+def polish_text_with_edits(text, settings):
+    """Asks the model for a compact list of edits and applies them locally. Raises EditOpsError if that fails."""
+    system_prompt = f"{settings['system_prompt']}\n\n{EDITS_INSTRUCTIONS}"
+    response_text = _generate(text, settings, system_prompt, temperature=0.2)
+    edits = parse_edit_ops(response_text)
+    print(f"DEBUG: Edit-operations polish: {len(edits)} edit(s), {len(response_text)} response chars for {len(text)} input chars.")
+    return apply_edit_ops(text, edits)
+
+
+def stream_polished_text(text, settings):
+    """Like polish_text_with_service, but yields the polished text in chunks as the model produces them."""
+    service = settings.get("ai_service", "Gemini")
+
+    if service == "Light":
+        yield light_polish(text, settings.get("light_polish_dictionary"))
+    elif service == "Gemini":
+        model = get_gemini_model(settings['api_key'], settings['system_prompt'])
+        for chunk in model.generate_content(text, stream=True):
+            if chunk.text:
+                yield chunk.text
+    else: # Local AI, OpenAI-style server-sent events
+        headers = {"Content-Type": "application/json"}
+        data = _local_request_data(text, settings, stream=True)
+        with http_session.post(settings.get("local_model_url"), headers=headers, data=json.dumps(data), stream=True) as response:
+            response.raise_for_status()
+            for line in response.iter_lines(decode_unicode=True):
+                if not line or not line.startswith("data:"):
+                    continue
+                payload = line[len("data:"):].strip()
+                if payload == "[DONE]":
+                    break
+                delta = json.loads(payload)['choices'][0].get('delta', {}).get('content')
+                if delta:
+                    yield delta
+
+
+class BatchSplitError(ValueError):
+    """The model's answer to a batched request does not contain exactly one output per item."""
+
+
+def split_batch_response(response_text, count):
+    """Splits a marker-delimited batch answer into `count` texts. Raises BatchSplitError if any item is missing."""
+    matches = list(BATCH_MARKER_PATTERN.finditer(response_text))
+    numbers = [int(m.group(1)) for m in matches]
+    if numbers != list(range(1, count + 1)):
+        raise BatchSplitError(f"expected markers 1..{count}, got {numbers[:count + 5]}")
+    ends = [m.start() for m in matches[1:]] + [len(response_text)]
+    return [response_text[m.end():end].strip() for m, end in zip(matches, ends)]
+
+
+def polish_texts_batched(texts, settings):
+    """Polishes several texts with one request to the configured service. Raises BatchSplitError on a malformed answer."""
+    system_prompt = f"{settings['system_prompt']}\n\n{BATCH_INSTRUCTIONS.format(count=len(texts))}"
+    batch_input = "\n\n".join(f"{BATCH_MARKER.format(i)}\n{text.strip()}" for i, text in enumerate(texts, 1))
+    return split_batch_response(_generate(batch_input, settings, system_prompt), len(texts))
+
+
+class PolishBatcher:
+    """
+    Collects polish requests that arrive within max_wait_ms of each other and sends them as one batched
+    request (at most max_items per batch). polish() blocks the calling thread until its own result is
+    back. If the batched answer cannot be split, the items are polished one by one instead.
+    """
+
+    def __init__(self, max_wait_ms=100, max_items=8):
+        self.max_wait_ms = max_wait_ms
+        self.max_items = max_items
+        self.lock = threading.Lock()
+        self.batch_closed = threading.Condition(self.lock)
+        self.open_batches = {}
+        self.counters = {"requests": 0, "batches": 0, "batched_items": 0, "fallbacks": 0}
+
+    @staticmethod
+    def batch_key(settings):
+        # Only requests that would go to the same model with the same prompt can share a batch
+        return (settings.get("ai_service", "Gemini"), settings.get("system_prompt", ""),
+                settings.get("local_model_url"), settings.get("api_key"))
+
+    def _can_batch(self, text, settings):
+        if self.max_wait_ms <= 0 or self.max_items < 2 or settings.get("ai_service", "Gemini") == "Light":
+            return False
+        # Long texts in edits mode already get a compact answer of their own
+        return not (settings.get("polish_output_mode", "full") == "edits" and len(text) >= EDITS_MIN_CHARS)
+
+    def polish(self, text, settings):
+        """Polishes text, possibly together with other requests arriving at the same time."""
+        if not self._can_batch(text, settings):
+            return polish_text_with_service(text, settings)
+
+        item = {"text": text, "result": None, "error": None, "done": threading.Event()}
+        key = self.batch_key(settings)
+        with self.lock:
+            self.counters["requests"] += 1
+            batch = self.open_batches.get(key)
+            is_leader = batch is None
+            if is_leader:
+                batch = self.open_batches[key] = []
+            batch.append(item)
+            if len(batch) >= self.max_items:
+                del self.open_batches[key]
+                self.batch_closed.notify_all()
+
+            if is_leader: # The first request waits for company, then sends the batch for everyone
+                deadline = time.monotonic() + self.max_wait_ms / 1000.0
+                while self.open_batches.get(key) is batch:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        del self.open_batches[key]
+                        break
+                    self.batch_closed.wait(remaining)
+
+        if is_leader:
+            self._run_batch(batch, settings)
+        item["done"].wait()
+        if item["error"] is not None:
+            raise item["error"]
+        return item["result"]
+
+    def polish_many(self, texts, settings):
+        """Polishes a known list of texts right away, in batches of at most max_items. Returns the results in order."""
+        if not texts or not all(self._can_batch(text, settings) for text in texts):
+            return [polish_text_with_service(text, settings) for text in texts]
+        items = [{"text": text, "result": None, "error": None, "done": threading.Event()} for text in texts]
+        with self.lock:
+            self.counters["requests"] += len(items)
+        for start in range(0, len(items), self.max_items):
+            self._run_batch(items[start:start + self.max_items], settings)
+        for item in items:
+            if item["error"] is not None:
+                raise item["error"]
+        return [item["result"] for item in items]
+
+    def _run_batch(self, batch, settings):
+        try:
+            if len(batch) > 1:
+                try:
+                    results = polish_texts_batched([item["text"] for item in batch], settings)
+                    for item, result in zip(batch, results):
+                        item["result"] = result
+                    with self.lock:
+                        self.counters["batches"] += 1
+                        self.counters["batched_items"] += len(batch)
+                    print(f"DEBUG: Batched polish: {len(batch)} texts in one request.")
+                    return
+                except BatchSplitError as e:
+                    print(f"DEBUG: Batched polish answer could not be split ({e}); polishing {len(batch)} texts one by one.")
+                    with self.lock:
+                        self.counters["fallbacks"] += 1
+            for item in batch:
+                try:
+                    item["result"] = polish_text_with_service(item["text"], settings)
+                except Exception as e:
+                    item["error"] = e
+        except Exception as e:
+            for item in batch:
+                item["error"] = e
+        finally:
+            for item in batch:
+                item["done"].set()
+
+    def stats(self):
+        with self.lock:
+            return dict(self.counters)
+
+
+# --- Speculative background polishing ---
+class SpeculativePolisher:
+    """
+    Polishes transcript segments in the background while the user keeps dictating, so that a later
+    Polish click can reuse the results. Results are cached by (raw text, service, prompt); a single
+    low-priority worker thread processes the queue and holds off while a foreground polish is running.
+    """
+
+    MAX_CACHED = 256
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.cache = OrderedDict()
+        self.pending = deque()
+        self.wakeup = threading.Condition(self.lock)
+        self.foreground_polishes = 0
+        self.worker = None
+
+    @staticmethod
+    def cache_key(text, settings):
+        return (text.strip(), settings.get("ai_service", "Gemini"), settings.get("system_prompt", ""))
+
+    def lookup(self, text, settings):
+        with self.lock:
+            key = self.cache_key(text, settings)
+            if key in self.cache:
+                self.cache.move_to_end(key)
+                return self.cache[key]
+            return None
+
+    def store(self, text, settings, polished_text):
+        with self.lock:
+            self._store_locked(self.cache_key(text, settings), polished_text)
+
+    def _store_locked(self, key, polished_text):
+        self.cache[key] = polished_text
+        self.cache.move_to_end(key)
+        while len(self.cache) > self.MAX_CACHED:
+            self.cache.popitem(last=False)
+
+    def submit(self, text, settings):
+        if not text.strip():
+            return
+        with self.lock:
+            self.pending.append((text, dict(settings)))
+            if self.worker is None or not self.worker.is_alive():
+                self.worker = threading.Thread(target=self._run, daemon=True)
+                self.worker.start()
+            self.wakeup.notify()
+
+    def begin_foreground(self):
+        """Called before a user-initiated polish; background work waits until end_foreground()."""
+        with self.lock:
+            self.foreground_polishes += 1
+
+    def end_foreground(self):
+        with self.lock:
+            self.foreground_polishes -= 1
+            self.wakeup.notify()
+
+    def clear(self):
+        with self.lock:
+            self.pending.clear()
+            self.cache.clear()
+
+    def _run(self):
+        while True:
+            with self.lock:
+                while self.foreground_polishes or not self.pending:
+                    if self.pending: # A foreground polish is running; let it have the model
+                        self.wakeup.wait()
+                    elif not self.wakeup.wait(timeout=30) and not self.pending:
+                        self.worker = None # Idle: exit rather than outlive the work it was started for
+                        return
+                text, settings = self.pending.popleft()
+                key = self.cache_key(text, settings)
+                if key in self.cache:
+                    continue
+            try:
+                polished_text = polish_text_with_service(text.strip(), settings)
+            except Exception as e:
+                print(f"DEBUG: Background polish failed, segment will be polished on demand: {e}")
+                continue
+            with self.lock:
+                self._store_locked(key, polished_text)
+            print(f"DEBUG: Background polish ready for segment '{text.strip()[:40]}'")
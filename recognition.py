@@ -0,0 +1,190 @@
+import json
+import queue
+import struct
+import threading
+import uuid
+
+import requests
+import speech_recognition as sr
+
+from audio_processing import preprocess_audio, InProcessFlacAudioData
+from polishing import http_session
+
+
+def log_preprocess_stats(stats):
+    print(f"DEBUG: Preprocessed audio: {stats['input_seconds']:.2f}s -> {stats['output_seconds']:.2f}s, "
+          f"{stats['input_bytes']} -> {stats['output_bytes']} bytes (saved {stats['bytes_saved']}), "
+          f"CPU {stats['cpu_ms']:.1f} ms")
+    if not stats["speech_found"]:
+        print("DEBUG: No speech detected in audio, skipping recognition.")
+
+
+def signed_pcm(audio_data):
+    """
+    (raw bytes, sample width) of an AudioData in signed little-endian PCM. get_raw_data() turns 8-bit
+    audio signed while WAV (and pcm_to_float) treat 8-bit as unsigned, so 8-bit is widened to 16-bit.
+    """
+    if audio_data.sample_width == 1:
+        return audio_data.get_raw_data(convert_width=2), 2
+    return audio_data.get_raw_data(), audio_data.sample_width
+
+
+def preprocess_audio_data(audio_data):
+    """Runs the silence-trim/downmix/resample stage. Returns None when the utterance contains no speech."""
+    try:
+        raw, sample_width = signed_pcm(audio_data)
+        raw, sample_rate, sample_width, stats = preprocess_audio(raw, audio_data.sample_rate, sample_width)
+    except Exception as e:
+        print(f"DEBUG: Audio preprocessing failed, sending original audio: {e}")
+        return audio_data
+
+    log_preprocess_stats(stats)
+    if not stats["speech_found"]:
+        return None
+    return InProcessFlacAudioData(raw, sample_rate, sample_width)
+
+
+def prepare_audio_data(audio_data, settings):
+    """Preprocesses (if enabled) one utterance for recognition. Returns None if the audio holds no speech."""
+    if settings.get("preprocess_audio", True):
+        return preprocess_audio_data(audio_data)
+    if not isinstance(audio_data, InProcessFlacAudioData):
+        raw, sample_width = signed_pcm(audio_data)
+        return InProcessFlacAudioData(raw, audio_data.sample_rate, sample_width)
+    return audio_data
+
+
+def _recognize_google(recognizer, audio_data, settings):
+    return recognizer.recognize_google(audio_data)
+
+
+# --- OpenAI-compatible transcription server (/v1/audio/transcriptions, e.g. a local whisper server) ---
+WAV_UNKNOWN_SIZE = 0xFFFFFFFF  # RIFF/data length while the upload is still streaming; servers read to the end
+TRANSCRIPTION_CONNECT_TIMEOUT = 5.0  # Seconds; the read timeout is settings["transcription_timeout"]
+
+
+def wav_header(sample_rate, sample_width, data_size=None):
+    """44-byte header for mono PCM. Without data_size the lengths are left open for a streamed upload."""
+    riff_size = WAV_UNKNOWN_SIZE if data_size is None else 36 + data_size
+    data_size = WAV_UNKNOWN_SIZE if data_size is None else data_size
+    return (b"RIFF" + struct.pack("<I", riff_size) + b"WAVE"
+            + b"fmt " + struct.pack("<IHHIIHH", 16, 1, 1, sample_rate, sample_rate * sample_width, sample_width, sample_width * 8)
+            + b"data" + struct.pack("<I", data_size))
+
+
+def _transcription_request_parts(boundary, settings, sample_rate, sample_width, pcm_chunks, data_size=None):
+    """multipart/form-data body with the model name and the audio as a WAV file, as a stream of byte strings."""
+    fields = {"model": settings.get("local_transcription_model", "whisper-1"), "response_format": "json"}
+    for name, value in fields.items():
+        yield f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode()
+    yield (f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="audio.wav"\r\n'
+           f"Content-Type: audio/wav\r\n\r\n").encode()
+    yield wav_header(sample_rate, sample_width, data_size)
+    yield from pcm_chunks
+    yield f"\r\n--{boundary}--\r\n".encode()
+
+
+def _post_transcription(settings, sample_rate, sample_width, pcm_chunks, data_size=None):
+    """
+    Sends the audio to settings["local_transcription_url"] and returns the text. With data_size the body
+    is sent in one piece; without it, pcm_chunks is consumed as it fills and sent with chunked encoding.
+    """
+    boundary = uuid.uuid4().hex
+    body = _transcription_request_parts(boundary, settings, sample_rate, sample_width, pcm_chunks, data_size)
+    if data_size is not None:
+        body = b"".join(body)
+    headers = {"Content-Type": f"multipart/form-data; boundary={boundary}"}
+    try:
+        response = http_session.post(settings.get("local_transcription_url"), headers=headers, data=body,
+                                     timeout=(TRANSCRIPTION_CONNECT_TIMEOUT, transcription_timeout(settings)))
+        response.raise_for_status()
+        text = response.json().get("text", "").strip()
+    except (requests.RequestException, json.JSONDecodeError) as e:
+        raise sr.RequestError(f"transcription server request failed: {e}")
+    if not text:
+        raise sr.UnknownValueError()
+    return text
+
+
+def transcription_timeout(settings):
+    """Seconds to wait for the transcription server's answer once the audio is sent."""
+    return float(settings.get("transcription_timeout", 60))
+
+
+def _recognize_transcription_server(recognizer, audio_data, settings):
+    raw, sample_width = signed_pcm(audio_data)
+    return _post_transcription(settings, audio_data.sample_rate, sample_width, [raw], data_size=len(raw))
+
+
+class StreamingTranscription:
+    """
+    Uploads an utterance to the transcription server while it is still being recorded. feed() queues
+    PCM as it is captured and a background thread streams it out with chunked encoding, so when
+    recording stops only the tail of the audio and the server's answer are left to wait for.
+    """
+
+    def __init__(self, settings, sample_rate, sample_width):
+        self.sample_rate = sample_rate
+        self.sample_width = sample_width
+        self.chunks = queue.Queue()
+        self.text = None
+        self.error = None
+        self.thread = threading.Thread(target=self._upload, args=(dict(settings),), daemon=True)
+        self.thread.start()
+
+    def feed(self, pcm):
+        if self.error is None:
+            self.chunks.put(pcm)
+
+    def _pending_chunks(self):
+        while True:
+            chunk = self.chunks.get()
+            if chunk is None:
+                return
+            yield chunk
+
+    def _upload(self, settings):
+        try:
+            self.text = _post_transcription(settings, self.sample_rate, self.sample_width, self._pending_chunks())
+        except Exception as e:
+            self.error = e
+
+    def finish(self, timeout=None):
+        """Ends the upload and returns the text. Raises like the other speech services on failure."""
+        self.chunks.put(None)
+        self.thread.join(timeout)
+        if self.thread.is_alive():
+            raise sr.RequestError("transcription server did not answer in time")
+        if self.error is not None:
+            raise self.error
+        return self.text
+
+
+# --- Speech services, by the name stored in settings["speech_service"] ---
+SPEECH_SERVICES = {
+    "Google": _recognize_google,
+    "Transcription Server": _recognize_transcription_server,
+}
+
+# Services that can upload while recording is still in progress
+STREAMING_SPEECH_SERVICES = {
+    "Transcription Server": StreamingTranscription,
+}
+
+
+def recognize_audio_data(recognizer, audio_data, settings, service=None):
+    """Recognizes already prepared audio with the given (or configured) speech service. Errors are raised to the caller."""
+    service = service or settings.get("speech_service", "Google")
+    recognize = SPEECH_SERVICES.get(service, _recognize_google)
+    return recognize(recognizer, audio_data, settings)
+
+
+def transcribe_audio_data(recognizer, audio_data, settings):
+    """
+    Preprocesses (if enabled) and recognizes one utterance.
+    Returns the text, or None if the audio holds no speech. Recognizer errors are raised to the caller.
+    """
+    audio_data = prepare_audio_data(audio_data, settings)
+    if audio_data is None:
+        return None
+    return recognize_audio_data(recognizer, audio_data, settings)
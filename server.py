@@ -0,0 +1,308 @@
+import io
+import json
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+import speech_recognition as sr
+
+from polishing import PolishBatcher, stream_polished_text, warm_up_backend, polish_latency
+from recognition import transcribe_audio_data
+
+MAX_BODY_BYTES = 50 * 1024 * 1024
+LATENCY_WINDOW = 2048  # Latency samples kept per endpoint for the percentiles
+
+
+class ServerBusy(Exception):
+    pass
+
+
+class BadRequest(Exception):
+    """The client's request body is unusable; answered with 400. Backend failures are never reported this way."""
+
+
+class StreamAborted(Exception):
+    """Raised when a streamed response fails after its headers were already sent."""
+
+
+# --- Request metrics ---
+class RequestStats:
+    """Thread-safe per-endpoint counters and a sliding window of latencies."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started_at = time.monotonic()
+        self.endpoints = {}
+
+    def _entry(self, endpoint):
+        return self.endpoints.setdefault(endpoint, {
+            "completed": 0,
+            "errors": 0,
+            "rejected": 0,
+            "latencies_ms": deque(maxlen=LATENCY_WINDOW),
+            "finished_at": deque(maxlen=LATENCY_WINDOW),
+        })
+
+    def record(self, endpoint, latency_ms, ok=True):
+        with self.lock:
+            entry = self._entry(endpoint)
+            entry["completed" if ok else "errors"] += 1
+            entry["latencies_ms"].append(latency_ms)
+            entry["finished_at"].append(time.monotonic())
+
+    def record_rejected(self, endpoint):
+        with self.lock:
+            self._entry(endpoint)["rejected"] += 1
+
+    def snapshot(self):
+        now = time.monotonic()
+        with self.lock:
+            result = {"uptime_s": round(now - self.started_at, 1), "endpoints": {}}
+            for endpoint, entry in self.endpoints.items():
+                latencies = sorted(entry["latencies_ms"])
+                recent = sum(1 for t in entry["finished_at"] if now - t <= 60)
+                result["endpoints"][endpoint] = {
+                    "completed": entry["completed"],
+                    "errors": entry["errors"],
+                    "rejected": entry["rejected"],
+                    "throughput_rps": round((entry["completed"] + entry["errors"]) / max(now - self.started_at, 1e-6), 3),
+                    "throughput_last_60s_rps": round(recent / min(60.0, max(now - self.started_at, 1e-6)), 3),
+                    "latency_ms": {
+                        "p50": _percentile(latencies, 50),
+                        "p90": _percentile(latencies, 90),
+                        "p99": _percentile(latencies, 99),
+                        "max": round(latencies[-1], 1) if latencies else None,
+                    },
+                }
+            return result
+
+
+def _percentile(sorted_values, percent):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(percent / 100.0 * (len(sorted_values) - 1))))
+    return round(sorted_values[index], 1)
+
+
+# --- Service: shared recognizer/clients plus admission control ---
+class TranscriptionService:
+    """
+    Holds everything that is reused across requests and bounds how much work runs at once.
+    At most max_concurrency requests run; up to max_queue more wait for a slot, anything beyond that is rejected.
+    """
+
+    def __init__(self, settings, max_concurrency=4, max_queue=16, queue_timeout=30.0):
+        self.settings = settings
+        self.recognizer = sr.Recognizer()
+        self.stats = RequestStats()
+        self.slots = threading.BoundedSemaphore(max_concurrency)
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.waiting = 0
+        self.waiting_lock = threading.Lock()
+        # Concurrent /v1/polish requests from different clients share model round trips
+        self.polish_batcher = PolishBatcher(max_wait_ms=int(settings.get("polish_batch_wait_ms", 100)),
+                                            max_items=int(settings.get("polish_batch_max_items", 8)))
+
+    def acquire_slot(self):
+        with self.waiting_lock:
+            if self.waiting >= self.max_queue:
+                raise ServerBusy("Too many queued requests")
+            self.waiting += 1
+        try:
+            if not self.slots.acquire(timeout=self.queue_timeout):
+                raise ServerBusy("Timed out waiting for a free worker")
+        finally:
+            with self.waiting_lock:
+                self.waiting -= 1
+
+    def release_slot(self):
+        self.slots.release()
+
+    def transcribe(self, audio_bytes):
+        try:
+            with sr.AudioFile(io.BytesIO(audio_bytes)) as source:
+                audio_data = self.recognizer.record(source)
+        except (ValueError, EOFError) as e:
+            raise BadRequest(f"Audio could not be read as WAV, AIFF or FLAC: {e}")
+        try:
+            return transcribe_audio_data(self.recognizer, audio_data, self.settings) or ""
+        except sr.UnknownValueError:
+            return ""
+
+    def polish(self, text):
+        return self.polish_batcher.polish(text, self.settings)
+
+    def warm_up(self):
+        """Gets the AI service ready in the background so the first /v1/polish is not the slow one."""
+        if not self.settings.get("warm_up_model", True) or self.settings.get("ai_service", "Gemini") == "Light":
+            return
+
+        def run():
+            try:
+                print(f"DEBUG: serve: {self.settings.get('ai_service')} warm-up done in {warm_up_backend(self.settings):.0f} ms")
+            except Exception as e:
+                print(f"DEBUG: serve: warm-up failed, the first polish will be slower: {e}")
+        threading.Thread(target=run, daemon=True).start()
+
+    def polish_stream(self, text):
+        return stream_polished_text(text, self.settings)
+
+
+# --- HTTP layer ---
+class ServiceRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive and chunked responses for the streaming endpoint
+
+    @property
+    def service(self):
+        return self.server.service
+
+    def log_message(self, format, *args):
+        print(f"DEBUG: serve: {self.address_string()} {format % args}")
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+        if path == "/health":
+            self._send_json(200, {"status": "ok"})
+        elif path == "/v1/stats":
+            snapshot = self.service.stats.snapshot()
+            snapshot["polish_batching"] = self.service.polish_batcher.stats()
+            snapshot["polish_latency"] = polish_latency.report()
+            self._send_json(200, snapshot)
+        else:
+            self._send_json(404, {"error": "Not found"})
+
+    def do_POST(self):
+        path = urlparse(self.path).path
+        routes = {
+            "/v1/transcribe": self._handle_transcribe,
+            "/v1/polish": self._handle_polish,
+            "/v1/polish/stream": self._handle_polish_stream,
+        }
+        handler = routes.get(path)
+        if handler is None:
+            if self._read_body() is not None: # None: an error response was already sent
+                self._send_json(404, {"error": "Not found"})
+            return
+
+        body = self._read_body()
+        if body is None:
+            return
+
+        try:
+            self.service.acquire_slot()
+        except ServerBusy as e:
+            self.service.stats.record_rejected(path)
+            self._send_json(503, {"error": str(e)}, extra_headers={"Retry-After": "1"})
+            return
+
+        start = time.perf_counter()
+        ok = True
+        try:
+            handler(body)
+        except StreamAborted as e:
+            ok = False
+            print(f"DEBUG: serve: {path} stream aborted: {e}")
+        except BadRequest as e:
+            ok = False
+            self._send_json(400, {"error": str(e)})
+        except Exception as e:
+            ok = False
+            print(f"DEBUG: serve: {path} failed: {e}")
+            self._send_json(502, {"error": str(e)})
+        finally:
+            self.service.release_slot()
+            self.service.stats.record(path, (time.perf_counter() - start) * 1000.0, ok)
+
+    def _handle_transcribe(self, body):
+        if not body:
+            raise BadRequest("Request body must contain WAV, AIFF or FLAC audio")
+        start = time.perf_counter()
+        text = self.service.transcribe(body)
+        self._send_json(200, {"text": text, "latency_ms": round((time.perf_counter() - start) * 1000.0, 1)})
+
+    def _handle_polish(self, body):
+        text = self._text_from_json(body)
+        start = time.perf_counter()
+        polished = self.service.polish(text)
+        self._send_json(200, {"text": polished, "latency_ms": round((time.perf_counter() - start) * 1000.0, 1)})
+
+    def _handle_polish_stream(self, body):
+        text = self._text_from_json(body)
+        chunks = self.service.polish_stream(text)
+        first_chunk = next(chunks, "")  # Surface backend errors as a normal error response
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; charset=utf-8")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        try:
+            for chunk in _prepend(first_chunk, chunks):
+                data = chunk.encode("utf-8")
+                if data:
+                    self.wfile.write(f"{len(data):X}\r\n".encode("ascii") + data + b"\r\n")
+                    self.wfile.flush()
+            self.wfile.write(b"0\r\n\r\n")
+        except Exception as e:
+            # Too late for an error status; dropping the connection tells the client the stream is incomplete.
+            self.close_connection = True
+            raise StreamAborted(str(e))
+
+    def _text_from_json(self, body):
+        try:
+            text = json.loads(body.decode("utf-8")).get("text", "")
+        except (ValueError, AttributeError):
+            raise BadRequest('Request body must be JSON like {"text": "..."}')
+        if not isinstance(text, str) or not text.strip():
+            raise BadRequest("Nothing to polish.")
+        return text
+
+    def _read_body(self):
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+        except ValueError:
+            length = -1
+        if length < 0:
+            self.close_connection = True # The body's extent is unknown, so the connection cannot be reused
+            self._send_json(400, {"error": "Invalid Content-Length header"})
+            return None
+        if length > MAX_BODY_BYTES:
+            self.close_connection = True
+            self._send_json(413, {"error": f"Request body larger than {MAX_BODY_BYTES} bytes"})
+            return None
+        return self.rfile.read(length) if length else b""
+
+    def _send_json(self, status, payload, extra_headers=None):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (extra_headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def _prepend(first, rest):
+    yield first
+    yield from rest
+
+
+def run_server(settings, host="127.0.0.1", port=8765, max_concurrency=4, max_queue=16):
+    """Runs the headless transcribe/polish HTTP service until interrupted."""
+    httpd = ThreadingHTTPServer((host, port), ServiceRequestHandler)
+    httpd.daemon_threads = True
+    httpd.service = TranscriptionService(settings, max_concurrency=max_concurrency, max_queue=max_queue)
+    print(f"Serving on http://{host}:{httpd.server_address[1]} "
+          f"(POST /v1/transcribe, /v1/polish, /v1/polish/stream; GET /v1/stats) "
+          f"with {max_concurrency} workers and a queue of {max_queue}")
+    httpd.service.warm_up()
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
+        print(json.dumps(httpd.service.stats.snapshot(), indent=4))
@@ -0,0 +1,53 @@
+class TextSpanIndex:
+    """
+    Keeps track of character ranges in a text document as it is edited.
+
+    Each span is a dict with "start", "end" and any extra data the caller stores on it. Feed every
+    document edit to on_contents_change() (it takes the arguments of QTextDocument.contentsChange)
+    and the spans shift with the text. Text inserted exactly at a span's start is not part of the
+    span; an edit that touches a span's interior resizes it and sets span["touched"].
+    """
+
+    def __init__(self):
+        self._spans = []
+
+    def add(self, start, end, **data):
+        span = {"start": start, "end": end, "touched": False}
+        span.update(data)
+        self._spans.append(span)
+        self._spans.sort(key=lambda s: (s["start"], s["end"]))
+        return span
+
+    def remove(self, span):
+        self._spans = [s for s in self._spans if s is not span]
+
+    def contains(self, span):
+        return any(s is span for s in self._spans)
+
+    def clear(self):
+        self._spans = []
+
+    def spans(self):
+        """All spans, ordered by start position."""
+        return list(self._spans)
+
+    def overlapping(self, start, end):
+        """Spans that share at least one character with [start, end)."""
+        return [s for s in self._spans if s["start"] < end and start < s["end"]]
+
+    def on_contents_change(self, position, chars_removed, chars_added):
+        delta = chars_added - chars_removed
+        edit_end = position + chars_removed
+        for span in self._spans:
+            if edit_end <= span["start"]:
+                # Entirely before the span (an insertion at its start counts as before)
+                span["start"] += delta
+                span["end"] += delta
+            elif position >= span["end"]:
+                continue # Entirely after the span
+            else:
+                span["start"] = min(span["start"], position)
+                span["end"] = span["end"] + delta if edit_end < span["end"] else position + chars_added
+                span["end"] = max(span["end"], span["start"])
+                span["touched"] = True
+        self._spans.sort(key=lambda s: (s["start"], s["end"]))